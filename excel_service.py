@@ -1,8 +1,14 @@
 import os
+import re
+import copy
+import bisect
+import pickle
+import uuid
 import openpyxl
+from concurrent.futures import Executor
 from datetime import datetime
 from openpyxl.utils.exceptions import InvalidFileException
-from typing import List, Optional, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from models import (
     MasterStockProduct, JurnalPenjualan, JurnalPembelian, HargaJual
@@ -17,26 +23,103 @@ SHEET_MASTER_STOK = 'Sheet_1_Master_Stok'
 SHEET_JURNAL_PENJUALAN = 'Sheet_2_Jurnal_Penjualan'
 SHEET_JURNAL_PEMBELIAN = 'Sheet_3_Jurnal_Pembelian' 
 
+# --- KONFIGURASI MULTI-OUTLET (SHARD) ---
+# Outlet default memakai FILE_PATH. Outlet lain disimpan sebagai workbook terpisah
+# di folder yang sama: MyPos_<store_id>.xlsx
+DEFAULT_STORE_ID = 'default'
+STORE_FILE_PREFIX = 'MyPos_'
+STORE_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+# --- KONFIGURASI SNAPSHOT BACA ---
+# Setiap commit ke xlsx mem-publish snapshot immutable (pickle) di samping file data:
+# MyPos.snapshot.pkl. Semua jalur baca dilayani dari snapshot, hanya writer menyentuh xlsx.
+SNAPSHOT_VERSION = 5
+SNAPSHOT_SUFFIX = '.snapshot.pkl'
+# Identitas versi xlsx = (st_ino, st_mtime_ns). Workbook tulis membawa identitas file asal
+# muatnya di atribut ini, agar _save_workbook tahu snapshot mana yang boleh diteruskan inkremental.
+SOURCE_STAMP_ATTR = '_mypos_source_stamp'
+
+# Indeks waktu jurnal (sparse): satu entri per blok baris berisi rentang baris dan
+# timestamp min/max blok tersebut. Disimpan di dalam snapshot, diperbarui saat append.
+TIME_INDEX_BLOCK_ROWS = 256
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Cache snapshot yang sudah di-unpickle: {snapshot_path: ((st_ino, st_mtime_ns), snapshot)}
+_snapshot_cache: Dict[str, Tuple[Tuple[int, int], Dict]] = {}
+
 # Header untuk Master Stok (Sesuai urutan kolom)
 MASTER_STOK_HEADERS = [
     'Nama Produk', 'Satuan Beli', 'Isi per Satuan Beli', 'Kategori',
     'Satuan Unit Dasar', 'Harga jual (Bungkus)', 'Harga jual (Batang)', 
     'Harga jual (Mentah)', 'Harga jual (Seduh)', 'Harga jual (Rebus)', 
-    'Harga jual (Rebus+Telur)'
+    'Harga jual (Rebus+Telur)', 'Harga Modal (per Unit Dasar)', 'Stok (Unit Dasar)'
 ]
 
+# Kolom HPP di Master Stok (berbasis 1, untuk sheet.cell)
+# Harga modal = rata-rata tertimbang bergerak per unit dasar, diperbarui setiap pembelian.
+COL_HARGA_MODAL = 12
+COL_STOK_UNIT_DASAR = 13
+
 # Header untuk Jurnal Penjualan
 JURNAL_PENJUALAN_HEADERS = [
-    'Timestamp', 'Nama Produk', 'Jumlah Jual', 'Total Harga Jual', 'Catatan'
+    'Timestamp', 'Nama Produk', 'Jumlah Jual', 'Total Harga Jual', 'Catatan', 'HPP', 'Satuan Jual'
 ]
 
+# Cara jual yang menyajikan tepat satu unit dasar (harga jual mentah/seduh/rebus per unit dasar).
+# Rebus+Telur tidak termasuk: telurnya tidak ada di Master Stok, jadi HPP-nya tidak bisa lengkap.
+SATUAN_JUAL_SATU_UNIT_DASAR = {'mentah', 'seduh', 'rebus'}
+
 # Header untuk Jurnal Pembelian (Fixed: menggunakan 'Pembelian' bukan 'Pembalian')
 JURNAL_PEMBELIAN_HEADERS = [
     'Timestamp', 'Nama Produk', 'Jumlah Beli', 'Satuan Beli', 'Total Harga Beli'
 ]
 
-def _ensure_file_and_sheets():
-    """Memastikan file Excel dan semua sheet inti ada."""
+def get_store_file_path(store_id: Optional[str] = None) -> str:
+    """Mengembalikan path workbook untuk outlet tertentu (None = outlet default)."""
+    if store_id is None or store_id == DEFAULT_STORE_ID:
+        return FILE_PATH
+    if not STORE_ID_PATTERN.fullmatch(store_id):
+        raise ValueError(f"Store id '{store_id}' tidak valid (hanya huruf, angka, '-' dan '_').")
+    return os.path.join(os.path.dirname(FILE_PATH), f"{STORE_FILE_PREFIX}{store_id}.xlsx")
+
+def list_stores() -> List[str]:
+    """Mendaftar semua outlet yang workbook-nya sudah ada di folder data."""
+    data_dir = os.path.dirname(FILE_PATH)
+    stores = []
+    if os.path.exists(FILE_PATH):
+        stores.append(DEFAULT_STORE_ID)
+    if os.path.isdir(data_dir):
+        for filename in sorted(os.listdir(data_dir)):
+            if filename.startswith(STORE_FILE_PREFIX) and filename.endswith('.xlsx'):
+                store_id = filename[len(STORE_FILE_PREFIX):-len('.xlsx')]
+                if STORE_ID_PATTERN.fullmatch(store_id) and store_id != DEFAULT_STORE_ID:
+                    stores.append(store_id)
+    return stores
+
+class StoreNotFoundError(ValueError):
+    """Outlet selain default belum punya workbook (jalur baca tidak membuat shard baru)."""
+
+def store_exists(store_id: Optional[str] = None) -> bool:
+    """True jika workbook outlet sudah ada. Outlet default selalu dianggap ada (dibuat saat dibutuhkan)."""
+    file_path = get_store_file_path(store_id)
+    return file_path == FILE_PATH or os.path.exists(file_path)
+
+def _require_store_file(store_id: Optional[str] = None) -> str:
+    """
+    Path workbook untuk jalur baca. Outlet default dibuat jika belum ada; outlet lain
+    harus sudah dibuat lewat jalur tulis, agar `?store=` yang salah ketik tidak membuat shard.
+    """
+    file_path = get_store_file_path(store_id)
+    if not os.path.exists(file_path):
+        if file_path != FILE_PATH:
+            raise StoreNotFoundError(f"Outlet '{store_id}' tidak ditemukan.")
+        _ensure_file_and_sheets(store_id)
+    return file_path
+
+def _ensure_file_and_sheets(store_id: Optional[str] = None):
+    """Memastikan file Excel dan semua sheet inti ada. Mengembalikan workbook (mode tulis)."""
+    file_path = get_store_file_path(store_id)
+    changed = False
     
     # 1. DEFINISIKAN DICTIONARY DI AWAL FUNGSI
     sheets_to_check = {
@@ -46,20 +129,26 @@ def _ensure_file_and_sheets():
     }
     
     # 2. FILE CHECK AND LOAD
-    if not os.path.exists(FILE_PATH):
-        print(f"⚠️ File TIDAK DITEMUKAN di: {FILE_PATH}. Membuat workbook baru...")
-        os.makedirs(os.path.dirname(FILE_PATH), exist_ok=True)
+    if not os.path.exists(file_path):
+        print(f"⚠️ File TIDAK DITEMUKAN di: {file_path}. Membuat workbook baru...")
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
         workbook = openpyxl.Workbook()
+        source_stamp = None
         
         default_sheet = workbook.active
         if default_sheet.title == 'Sheet':
             workbook.remove(default_sheet)
+        changed = True
     else:
         try:
-            workbook = openpyxl.load_workbook(FILE_PATH)
+            # Identitas diambil dari handle yang sama dengan yang dibaca, bukan dari path
+            with open(file_path, 'rb') as f:
+                source_stamp = _file_stamp(os.fstat(f.fileno()))
+                workbook = openpyxl.load_workbook(f)
             print("👍 File DITEMUKAN. Melanjutkan dengan workbook yang ada.")
         except InvalidFileException:
-            raise Exception("File MyPos.xlsx rusak atau tidak valid.")
+            raise Exception(f"File {os.path.basename(file_path)} rusak atau tidak valid.")
+    setattr(workbook, SOURCE_STAMP_ATTR, source_stamp)
 
     # 3. SHEET CHECK
     for sheet_name, headers in sheets_to_check.items():
@@ -67,77 +156,323 @@ def _ensure_file_and_sheets():
             print(f"   [NOTICE] Sheet '{sheet_name}' hilang. Ditambahkan.")
             sheet = workbook.create_sheet(sheet_name)
             sheet.append(headers)
+            changed = True
+        else:
+            # Migrasi: tambahkan header kolom baru pada file lama
+            sheet = workbook[sheet_name]
+            for col_idx, header in enumerate(headers, start=1):
+                if sheet.cell(row=1, column=col_idx).value is None:
+                    sheet.cell(row=1, column=col_idx, value=header)
+                    changed = True
 
-    workbook.save(FILE_PATH)
+    # Hanya simpan jika ada perubahan, agar jalur baca tidak ikut menulis xlsx
+    if changed:
+        _save_workbook(workbook, store_id)
+    return workbook
 
-def _get_workbook_and_sheet(sheet_name: str, read_only:bool = False):
+def _get_workbook_and_sheet(sheet_name: str, read_only:bool = False, store_id: Optional[str] = None):
     """Helper untuk memuat workbook dan mendapatkan sheet tertentu."""
-    _ensure_file_and_sheets()
+    file_path = _require_store_file(store_id) if read_only else get_store_file_path(store_id)
     try:
-        workbook = openpyxl.load_workbook(FILE_PATH, read_only=read_only)
+        if read_only and os.path.exists(file_path):
+            # Mode baca: langsung buka read-only, workbook penuh hanya dimuat jika sheet hilang
+            workbook = openpyxl.load_workbook(file_path, read_only=True)
+            if sheet_name in workbook.sheetnames:
+                return workbook, workbook[sheet_name]
+            workbook.close()
+
+        workbook = _ensure_file_and_sheets(store_id)
+        if read_only:
+            workbook = openpyxl.load_workbook(file_path, read_only=True)
         sheet = workbook[sheet_name]
         return workbook, sheet
     except (KeyError, InvalidFileException) as e:
         raise Exception(f"Gagal memuat sheet {sheet_name}: {e}")
 
-# --- FUNGSI UTAMA (CRUD MASTER STOK) ---
-def read_master_stock() -> List[MasterStockProduct]:
-    """Membaca semua produk dari Sheet Master Stok."""
-    _, sheet = _get_workbook_and_sheet(SHEET_MASTER_STOK, read_only=True)
-    
-    products: List[MasterStockProduct] = []
-    
-    # Iterasi dari baris ke-2 (data)
-    for row_idx, row in enumerate(sheet.iter_rows(min_row=2, values_only=True)):
-        if not row[0]: # Lewati baris kosong jika kolom pertama kosong
-            continue
+def _save_workbook(workbook, store_id: Optional[str] = None):
+    """
+    Commit workbook ke xlsx secara atomik (tulis file sementara lalu rename),
+    kemudian publish snapshot baca yang baru.
+    """
+    file_path = get_store_file_path(store_id)
+    snapshot_path = _snapshot_path(file_path)
+
+    # Snapshot lama hanya dipakai untuk update inkremental jika dibangun dari versi xlsx yang
+    # sama dengan yang dimuat workbook ini. Jika writer lain sudah menyimpan di antaranya,
+    # baris baru kedua writer ada di nomor baris yang sama, jadi snapshot dibangun penuh.
+    previous = None
+    loaded_stamp = getattr(workbook, SOURCE_STAMP_ATTR, None)
+    if loaded_stamp is not None:
+        previous = _read_snapshot_file(snapshot_path)
+        if previous is not None and previous['source_stamp'] != loaded_stamp:
+            previous = None
 
-        # Mapping data berdasarkan urutan kolom
-        harga_jual_data = {
-            'bungkus': row[5], 'batang': row[6], 'mentah': row[7],
-            'seduh': row[8], 'rebus': row[9], 'rebus_telur': row[10],
+    tmp_path = _temp_path_for(file_path)
+    try:
+        workbook.save(tmp_path)
+        # rename mempertahankan inode dan mtime, jadi identitas file sementara = identitas xlsx baru
+        source_stamp = _file_stamp(os.stat(tmp_path))
+        os.replace(tmp_path, file_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    setattr(workbook, SOURCE_STAMP_ATTR, source_stamp)
+    _write_snapshot(_build_snapshot(workbook, source_stamp, previous), snapshot_path)
+
+# --- SNAPSHOT BACA ---
+
+def _temp_path_for(path: str) -> str:
+    """Path file sementara unik di folder yang sama (agar os.replace tetap atomik)."""
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, f".tmp-{uuid.uuid4().hex}-{filename}")
+
+def _snapshot_path(file_path: str) -> str:
+    return os.path.splitext(file_path)[0] + SNAPSHOT_SUFFIX
+
+def _file_stamp(stat) -> Tuple[int, int]:
+    return (stat.st_ino, stat.st_mtime_ns)
+
+def _empty_journal_snapshot() -> Dict:
+    return {
+        'max_row': 1,
+        'ringkasan': {'total': 0.0, 'hpp': 0.0, 'jumlah_transaksi': 0, 'jumlah_tanpa_hpp': 0, 'per_produk': {}},
+        'indeks_waktu': {
+            'baris_awal': [], 'baris_akhir': [], 'ts_min': [], 'ts_max': [],
+            # False jika pernah ada baris dengan timestamp mundur (misal sinkronisasi terminal offline)
+            'urut': True,
+        },
+    }
+
+def _timestamp_str(value) -> str:
+    """Menormalkan nilai kolom Timestamp (string atau datetime dari Excel) ke TIMESTAMP_FORMAT."""
+    if isinstance(value, datetime):
+        return value.strftime(TIMESTAMP_FORMAT)
+    return str(value)
+
+def _index_append(indeks: Dict, row_idx: int, timestamp: str):
+    """Mencatat satu baris baru ke indeks waktu (membuka blok baru setiap TIME_INDEX_BLOCK_ROWS baris)."""
+    if indeks['ts_max'] and timestamp < indeks['ts_max'][-1]:
+        indeks['urut'] = False
+
+    if not indeks['baris_awal'] or row_idx - indeks['baris_awal'][-1] >= TIME_INDEX_BLOCK_ROWS:
+        indeks['baris_awal'].append(row_idx)
+        indeks['baris_akhir'].append(row_idx)
+        indeks['ts_min'].append(timestamp)
+        indeks['ts_max'].append(timestamp)
+        return
+
+    indeks['baris_akhir'][-1] = row_idx
+    indeks['ts_min'][-1] = min(indeks['ts_min'][-1], timestamp)
+    indeks['ts_max'][-1] = max(indeks['ts_max'][-1], timestamp)
+
+def _update_journal_snapshot(
+    sheet, qty_col: int, total_col: int, previous: Optional[Dict] = None, hpp_col: Optional[int] = None
+) -> Dict:
+    """
+    Memperbarui ringkasan jurnal secara inkremental: hanya baris setelah `max_row`
+    snapshot sebelumnya yang dibaca (jurnal bersifat append-only).
+    """
+    if previous is None:
+        journal = _empty_journal_snapshot()
+    else:
+        journal = {
+            'max_row': previous['max_row'],
+            'ringkasan': copy.deepcopy(previous['ringkasan']),
+            # Salin list-nya saja: snapshot lama tetap immutable
+            'indeks_waktu': {
+                key: list(value) if isinstance(value, list) else value
+                for key, value in previous['indeks_waktu'].items()
+            },
         }
-        
-        try:
-            product_data = {
-                'nama_produk': row[0],
-                'satuan_beli': row[1],
-                # Konversi ke int/float dan handle None
-                'isi_per_satuan_beli': int(row[2]) if row[2] else 0,
-                'kategori': row[3] or '',
-                'satuan_unit_dasar': row[4] or '',
-                'harga_jual': HargaJual(**{k: float(v) if v is not None else None for k, v in harga_jual_data.items()})
-            }
-            product = MasterStockProduct(**product_data)
-            products.append(product)
-        except Exception as e:
-            # Print error spesifik untuk debugging Excel
-            print(f"Error memuat produk '{row[0]}' di baris {row_idx + 2}: {e}")
+    if sheet is None:
+        return journal
+
+    ringkasan = journal['ringkasan']
+    indeks = journal['indeks_waktu']
+    start_row = journal['max_row'] + 1
+    for row_idx, row in enumerate(sheet.iter_rows(min_row=start_row, values_only=True), start=start_row):
+        journal['max_row'] = row_idx
+        if not row or len(row) <= total_col or not row[1]:
             continue
+        if row[0] is not None:
+            _index_append(indeks, row_idx, _timestamp_str(row[0]))
 
-    return products
+        jumlah = int(row[qty_col] or 0)
+        total = float(row[total_col] or 0)
+        produk = ringkasan['per_produk'].setdefault(row[1], {'jumlah': 0, 'total': 0.0, 'hpp': 0.0})
+        produk['jumlah'] += jumlah
+        produk['total'] += total
+        ringkasan['total'] += total
+        ringkasan['jumlah_transaksi'] += 1
 
-def get_product_by_name(nama_produk: str) -> Optional[Tuple[MasterStockProduct, int]]:
-    """Mencari produk berdasarkan nama, mengembalikan produk dan nomor barisnya (untuk Update/Delete)."""
-    # Menggunakan read_master_stock untuk mendapatkan produk dari model, lalu cari index
-    all_products = read_master_stock()
-    found_product = next((p for p in all_products if p.nama_produk.lower() == nama_produk.lower()), None)
+        if hpp_col is not None:
+            hpp = row[hpp_col] if len(row) > hpp_col else None
+            if hpp is None:
+                # Baris lama sebelum HPP dicatat
+                ringkasan['jumlah_tanpa_hpp'] += 1
+            else:
+                produk['hpp'] += float(hpp)
+                ringkasan['hpp'] += float(hpp)
 
-    if found_product:
-        # Jika ditemukan, cari nomor baris aslinya di Excel (lambat, tapi akurat)
-        _, sheet = _get_workbook_and_sheet(SHEET_MASTER_STOK, read_only=True)
-        for row_idx, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-            if row[0] and row[0].lower() == nama_produk.lower():
-                return found_product, row_idx
-    
+    return journal
+
+def _build_snapshot(workbook, source_stamp: Tuple[int, int], previous: Optional[Dict] = None) -> Dict:
+    """Membangun snapshot dari workbook yang sedang terbuka (baris Master Stok + ringkasan dan indeks waktu jurnal)."""
+    def get_sheet(name):
+        return workbook[name] if name in workbook.sheetnames else None
+
+    master_sheet = get_sheet(SHEET_MASTER_STOK)
+    master_rows = [] if master_sheet is None else [
+        tuple(row) for row in master_sheet.iter_rows(min_row=2, values_only=True)
+    ]
+
+    previous_journals = previous['jurnal'] if previous else {}
+    journals = {
+        SHEET_JURNAL_PENJUALAN: _update_journal_snapshot(
+            get_sheet(SHEET_JURNAL_PENJUALAN), 2, 3, previous_journals.get(SHEET_JURNAL_PENJUALAN), hpp_col=5
+        ),
+        SHEET_JURNAL_PEMBELIAN: _update_journal_snapshot(
+            get_sheet(SHEET_JURNAL_PEMBELIAN), 2, 4, previous_journals.get(SHEET_JURNAL_PEMBELIAN)
+        ),
+    }
+
+    return {
+        'versi': SNAPSHOT_VERSION,
+        'source_stamp': source_stamp,
+        'master_stok': master_rows,
+        'jurnal': journals,
+    }
+
+def _write_snapshot(snapshot: Dict, snapshot_path: str):
+    """Menulis snapshot ke file sementara lalu menukarnya secara atomik dengan rename."""
+    tmp_path = _temp_path_for(snapshot_path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _read_snapshot_file(snapshot_path: str) -> Optional[Dict]:
+    """Membaca snapshot dari disk (di-cache per inode+mtime). None jika tidak ada/tidak valid."""
+    try:
+        stat = os.stat(snapshot_path)
+    except FileNotFoundError:
+        return None
+
+    cache_key = (stat.st_ino, stat.st_mtime_ns)
+    cached = _snapshot_cache.get(snapshot_path)
+    if cached is not None and cached[0] == cache_key:
+        return cached[1]
+
+    try:
+        with open(snapshot_path, 'rb') as f:
+            snapshot = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('versi') != SNAPSHOT_VERSION:
+        return None
+
+    _snapshot_cache[snapshot_path] = (cache_key, snapshot)
+    return snapshot
+
+def _load_snapshot_file(file_path: str) -> Dict:
+    """
+    Mengembalikan snapshot terbaru untuk file data. Jika snapshot belum ada atau
+    xlsx diubah di luar aplikasi, snapshot dibangun ulang dari xlsx (read-only).
+    """
+    snapshot_path = _snapshot_path(file_path)
+    source_stamp = _file_stamp(os.stat(file_path))
+
+    snapshot = _read_snapshot_file(snapshot_path)
+    if snapshot is not None and snapshot['source_stamp'] == source_stamp:
+        return snapshot
+
+    workbook = openpyxl.load_workbook(file_path, read_only=True)
+    try:
+        # Pakai identitas sebelum membaca: jika ada writer di tengah jalan, snapshot ini otomatis dianggap basi
+        snapshot = _build_snapshot(workbook, source_stamp)
+    finally:
+        workbook.close()
+    _write_snapshot(snapshot, snapshot_path)
+    return snapshot
+
+def _load_snapshot(store_id: Optional[str] = None) -> Dict:
+    """Snapshot baca untuk satu outlet (file data outlet default dibuat jika belum ada)."""
+    return _load_snapshot_file(_require_store_file(store_id))
+
+def _clean_float(val) -> Optional[float]:
+    """Bersihkan nilai string None atau '-' menjadi None."""
+    if val is None or str(val).strip() in ['-', '']:
+        return None
+    try:
+        return float(val)
+    except ValueError:
+        return None # Jika tidak bisa di-float
+
+def _row_to_master_product(row) -> MasterStockProduct:
+    """Membangun MasterStockProduct dari satu baris Master Stok (urutan kolom sesuai header)."""
+    row = tuple(row) + (None,) * (len(MASTER_STOK_HEADERS) - len(row))
+
+    # Ambil data harga jual (sesuai urutan di header: kolom 6 sampai 11)
+    harga_jual_data = {
+        'bungkus': row[5], 'batang': row[6], 'mentah': row[7],
+        'seduh': row[8], 'rebus': row[9], 'rebus_telur': row[10],
+    }
+
+    return MasterStockProduct(
+        nama_produk=row[0],
+        satuan_beli=row[1],
+        # Konversi ke int/float dan handle None
+        isi_per_satuan_beli=int(row[2]) if row[2] else 0,
+        kategori=row[3] or '',
+        satuan_unit_dasar=row[4] or '',
+        harga_jual=HargaJual(**{k: _clean_float(v) for k, v in harga_jual_data.items()}),
+        harga_modal=_clean_float(row[11]) or 0.0,
+        stok_unit_dasar=_clean_float(row[12]) or 0.0,
+    )
+
+def _normalize_unit(value) -> str:
+    return str(value or '').strip().lower().replace('_', ' ')
+
+def _sale_unit_factor(satuan_jual: Optional[str], satuan_unit_dasar, satuan_beli, isi_per_satuan_beli) -> Optional[float]:
+    """
+    Jumlah unit dasar dalam satu satuan jual, berdasarkan data Master Stok.
+    Satuan jual kosong berarti unit dasar. None jika konversinya tidak diketahui
+    (misal jual per Bungkus untuk produk dengan unit dasar Batang yang dibeli per Slop).
+    """
+    if satuan_jual is None:
+        return 1.0
+    jual = _normalize_unit(satuan_jual)
+    if jual == _normalize_unit(satuan_unit_dasar) or jual in SATUAN_JUAL_SATU_UNIT_DASAR:
+        return 1.0
+    isi = _clean_float(isi_per_satuan_beli)
+    if jual == _normalize_unit(satuan_beli) and isi:
+        return isi
     return None
 
-def create_master_stock(product: MasterStockProduct):
-    """Menambahkan produk baru ke Master Stok."""
-    if get_product_by_name(product.nama_produk):
+def _master_row_index(master_sheet) -> Dict[str, int]:
+    """Peta nama produk -> nomor baris Excel dari sheet Master Stok yang sedang terbuka."""
+    return {
+        row[0]: row_idx
+        for row_idx, row in enumerate(master_sheet.iter_rows(min_row=2, max_col=1, values_only=True), start=2)
+        if row[0]
+    }
+
+# --- FUNGSI UTAMA (CRUD MASTER STOK) ---
+def read_master_stock(store_id: Optional[str] = None) -> List[MasterStockProduct]:
+    """Membaca semua produk dari Sheet Master Stok (dilayani dari snapshot)."""
+    return list(iter_master_stock(store_id=store_id))
+
+def create_master_stock(product: MasterStockProduct, store_id: Optional[str] = None):
+    """Menambahkan produk baru ke Master Stok (membuat workbook outlet jika belum ada)."""
+    workbook, sheet = _get_workbook_and_sheet(SHEET_MASTER_STOK, store_id=store_id)
+    if product.nama_produk in _master_row_index(sheet):
         raise ValueError("Produk dengan nama ini sudah ada.")
-        
-    workbook, sheet = _get_workbook_and_sheet(SHEET_MASTER_STOK)
     
     # Siapkan data untuk baris baru
     harga_jual = product.harga_jual.model_dump()
@@ -146,21 +481,22 @@ def create_master_stock(product: MasterStockProduct):
         product.kategori, product.satuan_unit_dasar, 
         harga_jual['bungkus'], harga_jual['batang'], harga_jual['mentah'], 
         harga_jual['seduh'], harga_jual['rebus'], harga_jual['rebus_telur'],
+        product.harga_modal, product.stok_unit_dasar,
     ]
     
     sheet.append(row_data)
-    workbook.save(FILE_PATH)
+    _save_workbook(workbook, store_id)
     
-def update_master_stock(nama_produk_lama: str, updated_product: MasterStockProduct):
+def update_master_stock(nama_produk_lama: str, updated_product: MasterStockProduct, store_id: Optional[str] = None):
     """Memperbarui data produk berdasarkan nama produk lama."""
     
-    product_data_pair = get_product_by_name(nama_produk_lama)
+    product_data_pair = get_product_by_name(nama_produk_lama, store_id=store_id)
     if not product_data_pair:
         raise ValueError(f"Produk '{nama_produk_lama}' tidak ditemukan untuk diperbarui.")
         
     _, row_idx = product_data_pair
     
-    workbook, sheet = _get_workbook_and_sheet(SHEET_MASTER_STOK)
+    workbook, sheet = _get_workbook_and_sheet(SHEET_MASTER_STOK, store_id=store_id)
     
     # Siapkan data baru (sama seperti create)
     harga_jual = updated_product.harga_jual.model_dump()
@@ -171,112 +507,355 @@ def update_master_stock(nama_produk_lama: str, updated_product: MasterStockProdu
         harga_jual['seduh'], harga_jual['rebus'], harga_jual['rebus_telur'],
     ]
 
-    # Tulis data baru ke baris yang sudah ada
+    # Tulis data baru ke baris yang sudah ada.
+    # Harga modal & stok tidak ikut ditimpa: keduanya hanya berubah lewat jurnal.
     for col_idx, value in enumerate(new_row_data, start=1):
         sheet.cell(row=row_idx, column=col_idx, value=value)
         
-    workbook.save(FILE_PATH)
+    _save_workbook(workbook, store_id)
     
-def delete_master_stock(nama_produk: str):
+def delete_master_stock(nama_produk: str, store_id: Optional[str] = None):
     """Menghapus produk dari Master Stok berdasarkan nama."""
-    product_data_pair = get_product_by_name(nama_produk)
+    product_data_pair = get_product_by_name(nama_produk, store_id=store_id)
     if not product_data_pair:
         raise ValueError(f"Produk '{nama_produk}' tidak ditemukan untuk dihapus.")
         
     _, row_idx = product_data_pair
     
-    workbook, sheet = _get_workbook_and_sheet(SHEET_MASTER_STOK)
+    workbook, sheet = _get_workbook_and_sheet(SHEET_MASTER_STOK, store_id=store_id)
     
     # Hapus baris
     sheet.delete_rows(row_idx, 1)
     
-    workbook.save(FILE_PATH)
+    _save_workbook(workbook, store_id)
     
 # --- FUNGSI UTAMA (JURNAL TRANSAKSI) ---
 
-def write_sales_transaction(transactions: List[JurnalPenjualan]):
-    """Menulis transaksi penjualan ke sheet Jurnal Penjualan."""
-    workbook, sheet = _get_workbook_and_sheet(SHEET_JURNAL_PENJUALAN)
+def write_sales_transaction(transactions: List[JurnalPenjualan], store_id: Optional[str] = None):
+    """
+    Menulis transaksi penjualan ke sheet Jurnal Penjualan.
+    Jumlah jual dikonversi dari satuan jual ke unit dasar, lalu setiap baris dicap HPP
+    (jumlah unit dasar x harga modal rata-rata saat ini) dan stok dikurangi.
+    """
+    workbook, sheet = _get_workbook_and_sheet(SHEET_JURNAL_PENJUALAN, store_id=store_id)
+    master_sheet = workbook[SHEET_MASTER_STOK]
+    master_rows = _master_row_index(master_sheet)
     
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
     
     for t in transactions:
+        row_idx = master_rows.get(t.nama_produk)
+        if row_idx is not None:
+            faktor = _sale_unit_factor(
+                t.satuan_jual,
+                satuan_unit_dasar=master_sheet.cell(row=row_idx, column=5).value,
+                satuan_beli=master_sheet.cell(row=row_idx, column=2).value,
+                isi_per_satuan_beli=master_sheet.cell(row=row_idx, column=3).value,
+            )
+            if faktor is None:
+                # Konversi satuan jual tidak diketahui: HPP dikosongkan (tercatat di jumlah_tanpa_hpp)
+                # dan stok tidak diubah, daripada mencatat HPP dan stok yang salah skala
+                print(f"⚠️ Satuan jual '{t.satuan_jual}' untuk '{t.nama_produk}' tidak bisa dikonversi ke unit dasar. HPP dikosongkan.")
+                t.hpp = None
+            else:
+                jumlah_unit_dasar = t.jumlah_jual * faktor
+                harga_modal = _clean_float(master_sheet.cell(row=row_idx, column=COL_HARGA_MODAL).value) or 0.0
+                stok = _clean_float(master_sheet.cell(row=row_idx, column=COL_STOK_UNIT_DASAR).value) or 0.0
+                # Harga modal belum ada (belum pernah dibeli lewat aplikasi): HPP dikosongkan
+                # agar tercatat di jumlah_tanpa_hpp, bukan dianggap modal 0
+                t.hpp = round(jumlah_unit_dasar * harga_modal, 2) if harga_modal > 0 else None
+                master_sheet.cell(row=row_idx, column=COL_STOK_UNIT_DASAR, value=stok - jumlah_unit_dasar)
+        else:
+            # Produk di luar Master Stok: tidak ada harga modal untuk dicatat
+            t.hpp = None
+
         row_data = [
-            timestamp, t.nama_produk, t.jumlah_jual, t.total_harga_jual, t.catatan or None,
+            t.timestamp or timestamp, t.nama_produk, t.jumlah_jual, t.total_harga_jual, t.catatan or None, t.hpp,
+            t.satuan_jual,
         ]
         sheet.append(row_data)
         
-    workbook.save(FILE_PATH)
+    _save_workbook(workbook, store_id)
     
-def write_purchase_transaction(transactions: List[JurnalPembelian]):
-    """Menulis transaksi pembelian ke sheet Jurnal Pembelian."""
-    workbook, sheet = _get_workbook_and_sheet(SHEET_JURNAL_PEMBELIAN) # KOREKSI DI SINI JUGA!
+def write_purchase_transaction(transactions: List[JurnalPembelian], store_id: Optional[str] = None):
+    """
+    Menulis transaksi pembelian ke sheet Jurnal Pembelian dan memperbarui harga modal
+    rata-rata tertimbang per unit dasar di Master Stok (inkremental, tanpa membaca ulang riwayat).
+    """
+    workbook, sheet = _get_workbook_and_sheet(SHEET_JURNAL_PEMBELIAN, store_id=store_id) # KOREKSI DI SINI JUGA!
+    master_sheet = workbook[SHEET_MASTER_STOK]
+    master_rows = _master_row_index(master_sheet)
+
+    # Validasi semua produk dulu agar batch tidak tertulis setengah
+    for t in transactions:
+        if t.nama_produk not in master_rows:
+            raise ValueError(f"Produk '{t.nama_produk}' tidak ditemukan di Master Stok.")
     
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
     
     for t in transactions:
+        row_idx = master_rows[t.nama_produk]
+        isi_per_satuan_beli = int(_clean_float(master_sheet.cell(row=row_idx, column=3).value) or 0) or 1
+        harga_modal = _clean_float(master_sheet.cell(row=row_idx, column=COL_HARGA_MODAL).value) or 0.0
+        stok = _clean_float(master_sheet.cell(row=row_idx, column=COL_STOK_UNIT_DASAR).value) or 0.0
+
+        jumlah_unit_dasar = t.jumlah_beli * isi_per_satuan_beli
+        harga_modal_baru = weighted_average_cost(stok, harga_modal, jumlah_unit_dasar, t.total_harga_beli)
+
+        master_sheet.cell(row=row_idx, column=COL_HARGA_MODAL, value=harga_modal_baru)
+        master_sheet.cell(row=row_idx, column=COL_STOK_UNIT_DASAR, value=stok + jumlah_unit_dasar)
+
         row_data = [
             timestamp, t.nama_produk, t.jumlah_beli, t.satuan_beli, t.total_harga_beli,
         ]
         sheet.append(row_data)
         
-    workbook.save(FILE_PATH)
+    _save_workbook(workbook, store_id)
 
-def get_product_by_name(name: str) -> Optional[Tuple[MasterStockProduct, int]]:
+def get_product_by_name(name: str, store_id: Optional[str] = None) -> Optional[Tuple[MasterStockProduct, int]]:
     """
     Mencari produk di Master Stok berdasarkan nama.
     Mengembalikan tuple (product_model, row_index) atau None.
     """
-    _ensure_file_and_sheets()
-    
-    # Baca data dari Master Stok
-    workbook, sheet = _get_workbook_and_sheet(SHEET_MASTER_STOK, read_only=True)
+    # Baca data dari snapshot Master Stok (baris snapshot sejajar dengan baris Excel)
+    rows = _load_snapshot(store_id)['master_stok']
     
     # Mencari index baris yang sesuai (dimulai dari baris 2 setelah header)
-    for i, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
+    for i, row in enumerate(rows, start=2):
         # Asumsi nama produk ada di kolom pertama (index 0)
-        product_name_in_sheet = row[0]
-        
-        if product_name_in_sheet == name:
-            # Reconstruct model dari data baris (gunakan logika dari read_master_stock)
-            
-            # 1. Ambil data harga jual (sesuai urutan di header: kolom 6 sampai 11)
-            harga_jual_data = {
-                'bungkus': row[5], 'batang': row[6], 'mentah': row[7],
-                'seduh': row[8], 'rebus': row[9], 'rebus_telur': row[10]
-            }
-            
-            # Bersihkan nilai string None atau '-' menjadi None/0.0
-            def clean_float(val):
-                if val is None or str(val).strip() in ['-', '']:
-                    return None
-                try:
-                    return float(val)
-                except ValueError:
-                    return None # Jika tidak bisa di-float
-            
-            cleaned_harga_jual = {k: clean_float(v) for k, v in harga_jual_data.items()}
-            
-            # 2. Buat model HargaJual
-            harga_jual_model = HargaJual(**cleaned_harga_jual)
-            
-            # 3. Buat model MasterStockProduct
-            product_model = MasterStockProduct(
-                nama_produk=product_name_in_sheet,
-                satuan_beli=row[1],
-                isi_per_satuan_beli=int(row[2]) if row[2] is not None else 0,
-                kategori=row[3],
-                satuan_unit_dasar=row[4],
-                harga_jual=harga_jual_model
-            )
+        if row and row[0] == name:
+            product_model = _row_to_master_product(row)
             
             return product_model, i # Kembalikan model dan index baris Excel
             
     return None
 
-def update_master_stock_cost_price(name: str, new_cost_price: float):
-    """Memperbarui harga modal (kolom 2) produk di Master Stok."""
-    product_data_pair = get_product_by_name(name)
+# --- QUERY RENTANG WAKTU JURNAL ---
+
+def _normalize_time_bound(value, is_end: bool) -> str:
+    """Menormalkan batas waktu query. Tanggal saja berarti awal/akhir hari tersebut."""
+    if isinstance(value, datetime):
+        return value.strftime(TIMESTAMP_FORMAT)
+    value = str(value).strip()
+    if len(value) == 10:
+        value += ' 23:59:59' if is_end else ' 00:00:00'
+    try:
+        return datetime.strptime(value, TIMESTAMP_FORMAT).strftime(TIMESTAMP_FORMAT)
+    except ValueError:
+        raise ValueError(f"Format waktu '{value}' tidak valid (gunakan YYYY-MM-DD atau YYYY-MM-DD HH:MM:SS).")
+
+def _time_index_row_ranges(indeks: Dict, mulai: str, sampai: str) -> List[Tuple[int, int]]:
+    """Mencari rentang baris yang mungkin berisi timestamp antara `mulai` dan `sampai` (inklusif)."""
+    if indeks['urut']:
+        # Jurnal terurut: cukup binary search pada ts_max (blok pertama) dan ts_min (blok terakhir)
+        first = bisect.bisect_left(indeks['ts_max'], mulai)
+        last = bisect.bisect_right(indeks['ts_min'], sampai) - 1
+        if first > last:
+            return []
+        return [(indeks['baris_awal'][first], indeks['baris_akhir'][last])]
+
+    # Ada baris mundur: pilih blok yang rentang min/max-nya beririsan, lalu gabungkan yang bersebelahan
+    ranges: List[Tuple[int, int]] = []
+    for blok in range(len(indeks['baris_awal'])):
+        if indeks['ts_min'][blok] > sampai or indeks['ts_max'][blok] < mulai:
+            continue
+        start_row, end_row = indeks['baris_awal'][blok], indeks['baris_akhir'][blok]
+        if ranges and ranges[-1][1] + 1 >= start_row:
+            ranges[-1] = (ranges[-1][0], end_row)
+        else:
+            ranges.append((start_row, end_row))
+    return ranges
+
+def _row_to_sales(row) -> JurnalPenjualan:
+    """Membangun JurnalPenjualan dari satu baris Jurnal Penjualan."""
+    return JurnalPenjualan(
+        timestamp=_timestamp_str(row[0]),
+        nama_produk=row[1],
+        jumlah_jual=int(row[2]),
+        total_harga_jual=float(row[3]),
+        catatan=row[4] if len(row) > 4 else None,
+        hpp=_clean_float(row[5]) if len(row) > 5 else None,
+        satuan_jual=row[6] if len(row) > 6 else None,
+    )
+
+def _row_to_purchase(row) -> JurnalPembelian:
+    """Membangun JurnalPembelian dari satu baris Jurnal Pembelian."""
+    return JurnalPembelian(
+        timestamp=_timestamp_str(row[0]),
+        nama_produk=row[1],
+        jumlah_beli=int(row[2]),
+        satuan_beli=str(row[3]),
+        total_harga_beli=float(row[4]),
+    )
+
+# --- PEMBACA STREAMING ---
+
+def iter_batches(rows: Iterable, batch_size: int) -> Iterator[list]:
+    """Mengelompokkan iterator menjadi list berukuran `batch_size` (batch terakhir bisa lebih kecil)."""
+    if batch_size < 1:
+        raise ValueError("batch_size minimal 1.")
+    batch = []
+    try:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        # Berhenti lebih awal: tutup generator sumber agar workbook ikut ditutup
+        if hasattr(rows, 'close'):
+            rows.close()
+
+def _iter_master_rows(
+    store_id: Optional[str], nama_produk: Optional[str], kategori: Optional[str],
+    where: Optional[Callable[[MasterStockProduct], bool]], limit: Optional[int],
+) -> Iterator[MasterStockProduct]:
+    if limit is not None and limit <= 0:
+        return
+    count = 0
+    # Iterasi dari baris ke-2 (data)
+    for row_idx, row in enumerate(_load_snapshot(store_id)['master_stok'], start=2):
+        if not row or not row[0]: # Lewati baris kosong jika kolom pertama kosong
+            continue
+        # Filter kolom mentah dulu, model hanya dibangun untuk baris yang lolos
+        if nama_produk is not None and row[0] != nama_produk:
+            continue
+        if kategori is not None and row[3] != kategori:
+            continue
+
+        try:
+            product = _row_to_master_product(row)
+        except Exception as e:
+            # Print error spesifik untuk debugging Excel
+            print(f"Error memuat produk '{row[0]}' di baris {row_idx}: {e}")
+            continue
+
+        if where is not None and not where(product):
+            continue
+        yield product
+        count += 1
+        if limit is not None and count >= limit:
+            return
+
+def iter_master_stock(
+    store_id: Optional[str] = None,
+    nama_produk: Optional[str] = None,
+    kategori: Optional[str] = None,
+    where: Optional[Callable[[MasterStockProduct], bool]] = None,
+    limit: Optional[int] = None,
+    batch_size: Optional[int] = None,
+) -> Iterator:
+    """
+    Membaca Master Stok secara lazy (dari snapshot). `nama_produk`/`kategori` disaring
+    sebelum model dibangun, `where` menyaring model. Dengan `batch_size`, hasil berupa list per batch.
+    """
+    rows = _iter_master_rows(store_id, nama_produk, kategori, where, limit)
+    return iter_batches(rows, batch_size) if batch_size is not None else rows
+
+def _iter_journal_rows(
+    sheet_name: str, row_factory, store_id: Optional[str], nama_produk: Optional[str],
+    mulai, sampai, where: Optional[Callable], limit: Optional[int],
+) -> Iterator:
+    """Membaca jurnal baris per baris dari iter_rows read-only; workbook ditutup saat generator selesai/ditutup."""
+    if limit is not None and limit <= 0:
+        return
+    time_filter = mulai is not None or sampai is not None
+    if time_filter:
+        mulai = _normalize_time_bound(mulai, is_end=False) if mulai is not None else ''
+        sampai = _normalize_time_bound(sampai, is_end=True) if sampai is not None else '9999-12-31 23:59:59'
+        # Indeks waktu membatasi baris yang perlu dibaca
+        indeks = _load_snapshot(store_id)['jurnal'][sheet_name]['indeks_waktu']
+        ranges = _time_index_row_ranges(indeks, mulai, sampai)
+        if not ranges:
+            return
+    else:
+        ranges = [(2, None)]
+
+    workbook, sheet = _get_workbook_and_sheet(sheet_name, read_only=True, store_id=store_id)
+    try:
+        count = 0
+        for min_row, max_row in ranges:
+            for row_idx, row in enumerate(sheet.iter_rows(min_row=min_row, max_row=max_row, values_only=True), start=min_row):
+                if not row or row[0] is None or not row[1]:
+                    continue
+                # Filter kolom mentah dulu, model hanya dibangun untuk baris yang lolos
+                if nama_produk is not None and row[1] != nama_produk:
+                    continue
+                if time_filter and not (mulai <= _timestamp_str(row[0]) <= sampai):
+                    continue
+
+                try:
+                    item = row_factory(row)
+                except Exception as e:
+                    print(f"Error memuat baris {row_idx} di {sheet_name}: {e}")
+                    continue
+
+                if where is not None and not where(item):
+                    continue
+                yield item
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+    finally:
+        workbook.close()
+
+def iter_sales_journal(
+    store_id: Optional[str] = None,
+    nama_produk: Optional[str] = None,
+    mulai=None,
+    sampai=None,
+    where: Optional[Callable[[JurnalPenjualan], bool]] = None,
+    limit: Optional[int] = None,
+    batch_size: Optional[int] = None,
+) -> Iterator:
+    """
+    Membaca Jurnal Penjualan secara lazy. `nama_produk` dan rentang waktu `mulai`/`sampai`
+    disaring di loop baris (rentang waktu memakai indeks), `where` menyaring model.
+    Dengan `batch_size`, hasil berupa list per batch sehingga memori dibatasi ukuran batch.
+    """
+    rows = _iter_journal_rows(
+        SHEET_JURNAL_PENJUALAN, _row_to_sales, store_id, nama_produk, mulai, sampai, where, limit
+    )
+    return iter_batches(rows, batch_size) if batch_size is not None else rows
+
+def iter_purchase_journal(
+    store_id: Optional[str] = None,
+    nama_produk: Optional[str] = None,
+    mulai=None,
+    sampai=None,
+    where: Optional[Callable[[JurnalPembelian], bool]] = None,
+    limit: Optional[int] = None,
+    batch_size: Optional[int] = None,
+) -> Iterator:
+    """Membaca Jurnal Pembelian secara lazy (parameter sama dengan iter_sales_journal)."""
+    rows = _iter_journal_rows(
+        SHEET_JURNAL_PEMBELIAN, _row_to_purchase, store_id, nama_produk, mulai, sampai, where, limit
+    )
+    return iter_batches(rows, batch_size) if batch_size is not None else rows
+
+def read_sales_between(mulai, sampai, store_id: Optional[str] = None) -> List[JurnalPenjualan]:
+    """Transaksi penjualan dengan timestamp antara `mulai` dan `sampai` (inklusif)."""
+    return list(iter_sales_journal(store_id=store_id, mulai=mulai, sampai=sampai))
+
+def read_purchases_between(mulai, sampai, store_id: Optional[str] = None) -> List[JurnalPembelian]:
+    """Transaksi pembelian dengan timestamp antara `mulai` dan `sampai` (inklusif)."""
+    return list(iter_purchase_journal(store_id=store_id, mulai=mulai, sampai=sampai))
+
+def weighted_average_cost(stok: float, harga_modal: float, jumlah_masuk: float, total_harga_masuk: float) -> float:
+    """
+    Harga modal rata-rata tertimbang bergerak per unit dasar setelah barang masuk.
+    Jika stok lama habis/minus, harga modal langsung memakai harga pembelian baru.
+    """
+    harga_satuan_masuk = total_harga_masuk / jumlah_masuk
+    if stok <= 0:
+        return round(harga_satuan_masuk, 4)
+    return round((stok * harga_modal + total_harga_masuk) / (stok + jumlah_masuk), 4)
+
+def update_master_stock_cost_price(name: str, new_cost_price: float, store_id: Optional[str] = None):
+    """Mengoreksi harga modal per unit dasar produk di Master Stok secara manual."""
+    product_data_pair = get_product_by_name(name, store_id=store_id)
 
     if not product_data_pair:
         raise ValueError(f"Produk '{name}' tidak ditemukan di Master Stok.")
@@ -284,33 +863,92 @@ def update_master_stock_cost_price(name: str, new_cost_price: float):
     # Ambil index baris (i) dari get_product_by_name
     product_model, row_index = product_data_pair 
 
-    workbook, sheet = _get_workbook_and_sheet(SHEET_MASTER_STOK, read_only=False)
-
-    # Kolom harga modal berada di kolom B, yang berarti index kolom ke-2
-    # Kita menggunakan openpyxl: row[index_berbasis_1]
-    # Header Master Stok: [Nama Produk, Satuan Beli, Isi per Satuan Beli, Kategori, Satuan Unit Dasar, ...]
-    # Kolom 2: Satuan Beli. Kolom 1 (A) adalah Nama Produk.
-    
-    # Berdasarkan Header File: 'Nama Produk, Satuan Beli, Isi per Satuan Beli, Kategori, satuan Unit Dasar, Harga jual...'
-    # Harga modal (kolom 2) harusnya 'Satuan Beli', tapi di Jurnal Pembelian butuh harga modal!
-    
-    # ASUMSI: Berdasarkan header file yang di-upload, tidak ada kolom harga modal di Master Stok.
-    # Namun, karena Jurnal Pembelian membutuhkan harga modal terbaru, kita ASUMSIKAN:
-    # Harga Modal ditempatkan di KOLOM KEDUA Master Stok (sebelum Isi per Satuan Beli).
-    # KOREKSI: Karena kode kita sebelumnya tidak menyertakan Harga Modal di model dan header, 
-    # untuk sementara kita akan memperbarui Kolom 2 (Satuan Beli) DULU, dan perlu revisi model nanti!
+    workbook, sheet = _get_workbook_and_sheet(SHEET_MASTER_STOK, read_only=False, store_id=store_id)
+    sheet.cell(row=row_index, column=COL_HARGA_MODAL, value=new_cost_price)
     
-    # Skenario yang benar: Kita harus memperbarui kolom harga modal.
-    # Karena kita belum punya kolom harga modal di header/model, kita HANYA AKAN MENCATAT DI JURNAL PEMBELIAN
-    # dan MENGABAIKAN update Master Stok untuk sementara, KECUALI Anda tambahkan kolom Harga Modal (Beli) di Master Stok.
-    
-    # Untuk melanjutkan, kita ASUMSIKAN Anda telah menambahkan kolom "Harga Modal" (Index 1) di Master Stok Excel Anda.
-    # Header Baru (ASUMSI): [Nama Produk, Harga Modal Beli, Satuan Beli, Isi per Satuan Beli, ...]
-    
-    # Jika Asumsi Benar:
-    # Kolom Harga Modal Beli (Index 2 di Python, Kolom B di Excel)
-    CELL_MODAL_PRICE = 2 # Kolom ke-2 (B)
-    
-    sheet.cell(row=row_index, column=CELL_MODAL_PRICE, value=new_cost_price)
-    
-    workbook.save(FILE_PATH)
\ No newline at end of file
+    _save_workbook(workbook, store_id)
+
+def report_gross_margin(store_id: Optional[str] = None) -> Dict:
+    """
+    Laporan laba kotor: pendapatan - HPP, total dan per produk.
+    Diambil dari ringkasan snapshot, tidak memutar ulang jurnal.
+    """
+    ringkasan = _load_snapshot(store_id)['jurnal'][SHEET_JURNAL_PENJUALAN]['ringkasan']
+
+    def margin(pendapatan: float, hpp: float) -> Dict:
+        laba_kotor = pendapatan - hpp
+        return {
+            'pendapatan': pendapatan,
+            'hpp': hpp,
+            'laba_kotor': laba_kotor,
+            'margin_persen': round(100 * laba_kotor / pendapatan, 2) if pendapatan else 0.0,
+        }
+
+    report = margin(ringkasan['total'], ringkasan['hpp'])
+    report['jumlah_transaksi_tanpa_hpp'] = ringkasan['jumlah_tanpa_hpp']
+    report['per_produk'] = {
+        nama_produk: margin(data['total'], data['hpp'])
+        for nama_produk, data in ringkasan['per_produk'].items()
+    }
+    return report
+
+# --- LAPORAN LINTAS OUTLET ---
+
+def _summarize_sales_shard(store_id: str, file_path: str) -> Dict:
+    """
+    Meringkas Jurnal Penjualan satu outlet (dijalankan di worker process pool).
+    Ringkasan diambil dari snapshot; xlsx hanya diparse jika snapshot basi.
+    Menerima path file secara eksplisit agar tidak bergantung pada FILE_PATH di process anak.
+    """
+    ringkasan = _load_snapshot_file(file_path)['jurnal'][SHEET_JURNAL_PENJUALAN]['ringkasan']
+
+    return {
+        'store_id': store_id,
+        'total_pendapatan': ringkasan['total'],
+        'jumlah_transaksi': ringkasan['jumlah_transaksi'],
+        'per_produk': {
+            nama_produk: {'jumlah_jual': data['jumlah'], 'total_harga_jual': data['total']}
+            for nama_produk, data in ringkasan['per_produk'].items()
+        },
+    }
+
+def summarize_sales_across_stores(store_ids: Optional[List[str]] = None, executor: Optional[Executor] = None) -> Dict:
+    """
+    Laporan penjualan lintas outlet: total pendapatan dan penjualan per produk.
+    Dengan `executor` (process pool milik aplikasi), setiap shard diringkas di process terpisah;
+    tanpa executor, shard diringkas berurutan di process ini.
+    """
+    if store_ids is None:
+        store_ids = list_stores()
+    # Outlet yang disebut dua kali hanya dihitung sekali (urutan dipertahankan)
+    store_ids = list(dict.fromkeys(store_ids))
+
+    shards = []
+    for store_id in store_ids:
+        file_path = get_store_file_path(store_id)
+        if not os.path.exists(file_path):
+            raise StoreNotFoundError(f"Outlet '{store_id}' tidak ditemukan.")
+        shards.append((store_id, file_path))
+
+    if executor is None or len(shards) <= 1:
+        # Satu shard: tidak perlu bolak-balik ke process pool
+        results = [_summarize_sales_shard(*shard) for shard in shards]
+    else:
+        results = list(executor.map(_summarize_sales_shard, *zip(*shards)))
+
+    # Gabungkan hasil per outlet
+    per_produk: Dict[str, Dict[str, float]] = {}
+    for result in results:
+        for nama_produk, data in result['per_produk'].items():
+            produk = per_produk.setdefault(nama_produk, {'jumlah_jual': 0, 'total_harga_jual': 0.0})
+            produk['jumlah_jual'] += data['jumlah_jual']
+            produk['total_harga_jual'] += data['total_harga_jual']
+
+    return {
+        'per_outlet': {r['store_id']: {
+            'total_pendapatan': r['total_pendapatan'],
+            'jumlah_transaksi': r['jumlah_transaksi'],
+        } for r in results},
+        'total_pendapatan': sum(r['total_pendapatan'] for r in results),
+        'per_produk': per_produk,
+    }
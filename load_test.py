@@ -0,0 +1,331 @@
+"""
+Load generator untuk endpoint POS.
+
+Menjalankan skenario campuran (browse Master Stok, add-item, submit penjualan
+multi-item, submit pembelian) terhadap `app` secara in-process lewat ASGI
+transport, atau terhadap uvicorn lokal. Semua skenario memakai file data
+sementara, sehingga `MyPos.xlsx` asli tidak tersentuh. Route yang error di semua
+request ditandai di laporan dan membuat exit code 1.
+
+Contoh:
+    python load_test.py --concurrency 8 --requests 500
+    python load_test.py --uvicorn --concurrency 16 --duration 30
+    python load_test.py --mix browse=1,sales=3 --items-max 8
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+import excel_service
+from models import MasterStockProduct, HargaJual
+
+# --- KONFIGURASI DEFAULT ---
+DEFAULT_MIX = "browse=4,add-item=3,sales=2,purchase=1"
+SEED_PRODUCT_PREFIX = "Produk Uji"
+
+
+# --- STATISTIK ---
+
+class RouteStats:
+    """Menyimpan latensi dan jumlah error untuk satu route."""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.status_counts: Dict[str, int] = defaultdict(int)
+
+    def record(self, latency: float, status: str, is_error: bool):
+        self.latencies.append(latency)
+        self.status_counts[status] += 1
+        if is_error:
+            self.errors += 1
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Percentile nearest-rank dari list yang sudah terurut."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+# --- DATA UJI ---
+
+def seed_products(count: int) -> List[str]:
+    """Mengisi Master Stok di file sementara dengan produk uji."""
+    names = []
+    for i in range(count):
+        nama = f"{SEED_PRODUCT_PREFIX} {i + 1}"
+        excel_service.create_master_stock(MasterStockProduct(
+            nama_produk=nama,
+            satuan_beli="Karton",
+            isi_per_satuan_beli=24,
+            kategori="Uji",
+            satuan_unit_dasar="Bungkus",
+            harga_jual=HargaJual(bungkus=float(1000 + i * 250)),
+        ))
+        names.append(nama)
+    return names
+
+
+def sales_form(rng: random.Random, products: List[str], items_max: int) -> Dict[str, str]:
+    """Membangun payload form `/input-penjualan` dengan beberapa item."""
+    form = {"catatan": "load test"}
+    for idx in range(rng.randint(1, items_max)):
+        form[f"item_{idx}_nama_produk"] = rng.choice(products)
+        form[f"item_{idx}_jumlah_jual"] = str(rng.randint(1, 5))
+        form[f"item_{idx}_harga_jual_unit"] = str(rng.choice([1000, 2500, 3000, 5000]))
+        form[f"item_{idx}_satuan_jual"] = "Bungkus"
+    return form
+
+
+def purchase_form(rng: random.Random, products: List[str], items_max: int) -> Dict[str, str]:
+    """Membangun payload form `/input-pembelian` dengan beberapa item."""
+    form = {}
+    for idx in range(rng.randint(1, items_max)):
+        jumlah_beli = rng.randint(1, 3)
+        form[f"item_{idx}_nama_produk"] = rng.choice(products)
+        form[f"item_{idx}_jumlah_beli"] = str(jumlah_beli)
+        form[f"item_{idx}_satuan_beli"] = "Karton"
+        form[f"item_{idx}_total_harga_beli"] = str(jumlah_beli * rng.choice([20000, 45000, 60000]))
+    return form
+
+
+# --- SKENARIO ---
+# Setiap skenario memiliki label route dan coroutine yang mengembalikan response.
+
+async def scenario_browse(client, rng, products, items_max):
+    return await client.get("/master-stok")
+
+
+async def scenario_add_item(client, rng, products, items_max):
+    return await client.post(
+        "/input-penjualan/add-item", data={"nama_produk_select": rng.choice(products)}
+    )
+
+
+async def scenario_sales(client, rng, products, items_max):
+    return await client.post("/input-penjualan", data=sales_form(rng, products, items_max))
+
+
+async def scenario_purchase(client, rng, products, items_max):
+    return await client.post("/input-pembelian", data=purchase_form(rng, products, items_max))
+
+
+SCENARIOS = {
+    "browse": ("GET /master-stok", scenario_browse),
+    "add-item": ("POST /input-penjualan/add-item", scenario_add_item),
+    "sales": ("POST /input-penjualan", scenario_sales),
+    "purchase": ("POST /input-pembelian", scenario_purchase),
+}
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    """Parse string `nama=bobot,...` menjadi dict bobot skenario."""
+    weights = {}
+    for part in mix.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Skenario '{name}' tidak dikenal. Pilihan: {', '.join(SCENARIOS)}")
+        weights[name] = int(weight) if weight else 1
+    if not weights or sum(weights.values()) <= 0:
+        raise ValueError("Mix skenario kosong.")
+    return weights
+
+
+def is_error_response(response: httpx.Response) -> bool:
+    """Status >= 400 atau redirect ke halaman dengan `?error=` dihitung sebagai error."""
+    if response.status_code >= 400:
+        return True
+    location = response.headers.get("location", "")
+    return "error=" in location
+
+
+# --- RUNNER ---
+
+async def run_load(client: httpx.AsyncClient, products: List[str], args) -> Tuple[Dict[str, RouteStats], float]:
+    weights = parse_mix(args.mix)
+    names = list(weights)
+    cum_weights = [weights[n] for n in names]
+
+    stats: Dict[str, RouteStats] = defaultdict(RouteStats)
+    remaining = {"count": args.requests}
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    def take_slot() -> bool:
+        if deadline is not None:
+            return time.perf_counter() < deadline
+        if remaining["count"] <= 0:
+            return False
+        remaining["count"] -= 1
+        return True
+
+    async def worker(worker_id: int):
+        rng = random.Random(args.seed + worker_id)
+        while take_slot():
+            route, scenario = SCENARIOS[rng.choices(names, weights=cum_weights)[0]]
+            start = time.perf_counter()
+            try:
+                response = await scenario(client, rng, products, args.items_max)
+                latency = time.perf_counter() - start
+                stats[route].record(latency, str(response.status_code), is_error_response(response))
+            except Exception as e:
+                latency = time.perf_counter() - start
+                stats[route].record(latency, type(e).__name__, True)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    return stats, time.perf_counter() - started
+
+
+def failing_routes(stats: Dict[str, RouteStats]) -> List[str]:
+    """Route yang semua request-nya error: latensinya hanya mengukur jalur error, bukan route itu sendiri."""
+    return sorted(route for route, s in stats.items() if s.latencies and s.errors == len(s.latencies))
+
+
+def print_report(stats: Dict[str, RouteStats], elapsed: float, args):
+    total = sum(len(s.latencies) for s in stats.values())
+    total_errors = sum(s.errors for s in stats.values())
+
+    print(f"\n=== HASIL LOAD TEST ({args.mode}, concurrency={args.concurrency}) ===")
+    print(f"Durasi: {elapsed:.2f}s | Request: {total} | "
+          f"Throughput: {total / elapsed if elapsed else 0:.1f} req/s | "
+          f"Error: {total_errors} ({100 * total_errors / total if total else 0:.1f}%)\n")
+
+    header = f"{'Route':<34} {'n':>6} {'req/s':>8} {'err%':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  status"
+    print(header)
+    print("-" * len(header))
+    for route in sorted(stats):
+        s = stats[route]
+        lat = sorted(s.latencies)
+        n = len(lat)
+        statuses = ", ".join(f"{k}x{v}" for k, v in sorted(s.status_counts.items()))
+        print(
+            f"{route:<34} {n:>6} {n / elapsed if elapsed else 0:>8.1f} "
+            f"{100 * s.errors / n if n else 0:>6.1f} "
+            f"{percentile(lat, 50) * 1000:>9.1f} {percentile(lat, 95) * 1000:>9.1f} "
+            f"{percentile(lat, 99) * 1000:>9.1f}  {statuses}"
+        )
+
+    failing = failing_routes(stats)
+    if failing:
+        print(f"\n❌ {len(failing)} route error di SEMUA request; p50/p95/p99 di atas hanya mengukur jalur error:")
+        for route in failing:
+            print(f"   - {route} ({', '.join(sorted(stats[route].status_counts))})")
+        print("   Periksa log server (misal template yang belum ada) atau keluarkan route dari --mix.")
+
+
+# --- MODE SERVER ---
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_uvicorn(file_path: str, port: int) -> subprocess.Popen:
+    """Menjalankan uvicorn lokal di subprocess dengan FILE_PATH diarahkan ke file sementara."""
+    code = (
+        "import uvicorn, excel_service\n"
+        f"excel_service.FILE_PATH = {file_path!r}\n"
+        "from main import app\n"
+        f"uvicorn.run(app, host='127.0.0.1', port={port}, log_level='warning')\n"
+    )
+    process = subprocess.Popen([sys.executable, "-c", code], cwd=excel_service.SERVICE_DIR)
+
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("uvicorn berhenti sebelum siap (apakah uvicorn terpasang?).")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("uvicorn tidak siap dalam 15 detik.")
+
+
+async def main_async(args) -> int:
+    products = seed_products(args.products)
+
+    server: Optional[subprocess.Popen] = None
+    if args.uvicorn:
+        port = _free_port()
+        server = start_uvicorn(excel_service.FILE_PATH, port)
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout)
+    else:
+        from main import app
+        # Exception dari app dikembalikan sebagai 500, sama seperti server sungguhan
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        client = httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout)
+
+    try:
+        async with client:
+            stats, elapsed = await run_load(client, products, args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    print_report(stats, elapsed, args)
+    # Exit code != 0 agar hasil yang tidak bermakna tidak terbaca sebagai angka latensi yang valid
+    return 1 if failing_routes(stats) else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test untuk endpoint MyPOS.")
+    parser.add_argument("--uvicorn", action="store_true",
+                        help="Jalankan terhadap uvicorn lokal (default: in-process lewat ASGI transport).")
+    parser.add_argument("--concurrency", type=int, default=4, help="Jumlah worker paralel.")
+    parser.add_argument("--requests", type=int, default=200, help="Total request (diabaikan jika --duration dipakai).")
+    parser.add_argument("--duration", type=float, default=None, help="Durasi uji dalam detik.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Bobot skenario (default: {DEFAULT_MIX}).")
+    parser.add_argument("--products", type=int, default=20, help="Jumlah produk uji di Master Stok.")
+    parser.add_argument("--items-max", type=int, default=5, help="Maksimum item per submit form.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed random agar hasil bisa diulang.")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Timeout per request (detik).")
+    parser.add_argument("--keep-data", action="store_true", help="Jangan hapus file data sementara.")
+    args = parser.parse_args(argv)
+    args.mode = "uvicorn" if args.uvicorn else "in-process"
+    if args.concurrency < 1:
+        parser.error("--concurrency minimal 1")
+    parse_mix(args.mix)
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    data_dir = tempfile.mkdtemp(prefix="mypos-loadtest-")
+    original_file_path = excel_service.FILE_PATH
+    excel_service.FILE_PATH = os.path.join(data_dir, "MyPos.xlsx")
+    print(f"📁 File data sementara: {excel_service.FILE_PATH}")
+
+    try:
+        return asyncio.run(main_async(args))
+    finally:
+        excel_service.FILE_PATH = original_file_path
+        if args.keep_data:
+            print(f"📁 Data disimpan di: {data_dir}")
+        else:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,29 +1,43 @@
-from fastapi import FastAPI, Request, Form, Depends
+from fastapi import FastAPI, Request, Form, Depends, HTTPException, Header
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import ValidationError
 from typing import Optional
 from contextlib import asynccontextmanager # BARU: Untuk Lifespan
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import hmac
+import os
 
 import excel_service
-from models import JurnalPembelian, MasterStockProduct, HargaJual, JurnalPenjualan 
+import profiling
+from models import (
+    JurnalPembelian, MasterStockProduct, HargaJual, JurnalPenjualan,
+    SalesItemInput, SalesFormInput, SalesBatchInput
+)
+
+# Process pool untuk laporan lintas outlet: satu untuk seluruh aplikasi, dibuat saat startup
+process_pool: Optional[ProcessPoolExecutor] = None
 
 # --- 1. LIFESPAN HANDLER (Menggantikan @app.on_event) ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Jalankan saat server dimulai untuk memastikan file Excel ada."""
+    global process_pool
     print("🚀 Memulai server. Memeriksa file Excel...")
     try:
         excel_service._ensure_file_and_sheets()
         print("✅ File Excel sudah siap.")
     except Exception as e:
         print(f"❌ ERROR saat inisialisasi Excel: {e}. Lanjut menjalankan server.")
+    process_pool = ProcessPoolExecutor()
     
     # Yield untuk memberitahu FastAPI bahwa startup selesai, server bisa menerima request
     yield
     
     # Kode setelah yield akan berjalan saat shutdown (opsional)
+    process_pool.shutdown()
+    process_pool = None
     print("🛑 Server dimatikan.")
 
 # --- 2. INISIALISASI ---
@@ -37,38 +51,86 @@ app = FastAPI(
 # Setup Jinja2 Templates (Mengarah ke folder 'templates')
 templates = Jinja2Templates(directory="templates")
 
-# --- 3. ROUTES/ENDPOINTS ---
+# Profiling on-demand: scope di sekitar pemanggilan excel_service dan render template.
+# Tidak ada yang dibungkus selama profiling nonaktif.
+app.add_middleware(profiling.ProfilingMiddleware)
+profiling.instrument_module(excel_service)
+profiling.register(templates, "TemplateResponse", "templates.TemplateResponse")
+profiling.configure_from_env()
+
+# --- 3. DEPENDENCY OUTLET (MULTI-STORE) ---
+
+def get_store_id(store: Optional[str] = None) -> Optional[str]:
+    """Membaca outlet aktif dari query `?store=`. Kosong berarti outlet default."""
+    if not store:
+        return None
+    try:
+        excel_service.get_store_file_path(store)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return store
+
+def get_existing_store_id(store_id: Optional[str] = Depends(get_store_id)) -> Optional[str]:
+    """Outlet untuk jalur baca: outlet selain default harus sudah ada, tidak dibuat otomatis."""
+    if not excel_service.store_exists(store_id):
+        raise HTTPException(status_code=404, detail=f"Outlet '{store_id}' tidak ditemukan.")
+    return store_id
+
+def _with_store(url: str, store_id: Optional[str]) -> str:
+    """Menambahkan `store=` ke URL redirect agar user tetap di outlet yang sama."""
+    if not store_id:
+        return url
+    separator = '&' if '?' in url else '?'
+    return f"{url}{separator}store={store_id}"
+
+def _sales_form_to_journal(sales_form: SalesFormInput) -> list[JurnalPenjualan]:
+    """Mengubah satu keranjang penjualan menjadi baris-baris Jurnal Penjualan."""
+    transactions: list[JurnalPenjualan] = []
+    for item in sales_form.items:
+        transactions.append(JurnalPenjualan(
+            timestamp=sales_form.timestamp,
+            nama_produk=item.nama_produk,
+            jumlah_jual=item.jumlah_jual,
+            total_harga_jual=item.jumlah_jual * item.harga_jual_unit,
+            satuan_jual=item.satuan_jual,
+        ))
+
+    # Tambahkan catatan ke transaksi pertama (satu catatan untuk satu grup transaksi)
+    transactions[0].catatan = sales_form.catatan
+    return transactions
+
+# --- 4. ROUTES/ENDPOINTS ---
 
 # --- A. HOME / DASHBOARD ---
 @app.get("/", response_class=HTMLResponse)
-async def home(request: Request):
+async def home(request: Request, store_id: Optional[str] = Depends(get_existing_store_id)):
     """Menampilkan halaman utama/dashboard."""
     try:
-        products = excel_service.read_master_stock() 
+        products = excel_service.read_master_stock(store_id=store_id) 
     except Exception:
         products = [] 
 
     return templates.TemplateResponse(
         "home.html", 
-        {"request": request, "products": products, "title": "Dashboard Utama"}
+        {"request": request, "products": products, "title": "Dashboard Utama", "store_id": store_id}
     )
 
 # --- B. MASTER STOK (CRUD) ---
 
 @app.get("/master-stok", response_class=HTMLResponse)
-async def list_master_stok(request: Request, error: Optional[str] = None):
+async def list_master_stok(request: Request, error: Optional[str] = None, store_id: Optional[str] = Depends(get_existing_store_id)):
     """Menampilkan daftar semua Master Stok."""
     try:
-        products = excel_service.read_master_stock()
+        products = excel_service.read_master_stock(store_id=store_id)
     except Exception as e:
         return templates.TemplateResponse(
             "master_stok.html", 
-            {"request": request, "products": [], "error": str(e), "title": "Master Stok"}
+            {"request": request, "products": [], "error": str(e), "title": "Master Stok", "store_id": store_id}
         )
         
     return templates.TemplateResponse(
         "master_stok.html", 
-        {"request": request, "products": products, "error": error, "title": "Master Stok"}
+        {"request": request, "products": products, "error": error, "title": "Master Stok", "store_id": store_id}
     )
     
 # --- B.1. Create/Add New Product (POST Endpoint) ---
@@ -86,6 +148,7 @@ async def create_product(
     harga_jual_seduh: Optional[float] = Form(None),
     harga_jual_rebus: Optional[float] = Form(None),
     harga_jual_rebus_telur: Optional[float] = Form(None),
+    store_id: Optional[str] = Depends(get_store_id),
 ):
     try:
         harga_jual_data = HargaJual(
@@ -106,31 +169,31 @@ async def create_product(
             harga_jual=harga_jual_data
         )
 
-        excel_service.create_master_stock(new_product)
+        excel_service.create_master_stock(new_product, store_id=store_id)
         
     except (ValueError, ValidationError) as e:
         import urllib.parse
         error_msg = urllib.parse.quote(f"Error Validasi/Data: {e}")
         return RedirectResponse(
-            url=f"/master-stok?error={error_msg}", 
+            url=_with_store(f"/master-stok?error={error_msg}", store_id), 
             status_code=303
         )
     except Exception as e:
         import urllib.parse
         error_msg = urllib.parse.quote(f"Error tak terduga: {e}")
         return RedirectResponse(
-            url=f"/master-stok?error={error_msg}", 
+            url=_with_store(f"/master-stok?error={error_msg}", store_id), 
             status_code=303
         )
 
-    return RedirectResponse(url="/master-stok", status_code=303)
+    return RedirectResponse(url=_with_store("/master-stok", store_id), status_code=303)
 
 # --- B.2. Delete Product (POST Endpoint menggunakan HTMX) ---
 @app.post("/master-stok/delete/{nama_produk}", response_class=HTMLResponse)
-async def delete_product(request: Request, nama_produk: str):
+async def delete_product(request: Request, nama_produk: str, store_id: Optional[str] = Depends(get_store_id)):
     """Menghapus produk, khusus untuk HTMX (kembalikan empty response 200)."""
     try:
-        excel_service.delete_master_stock(nama_produk)
+        excel_service.delete_master_stock(nama_produk, store_id=store_id)
         return HTMLResponse(status_code=200)
 
     except ValueError as e:
@@ -139,30 +202,35 @@ async def delete_product(request: Request, nama_produk: str):
 # --- C. JURNAL PENJUALAN ---
 
 @app.get("/input-penjualan", response_class=HTMLResponse)
-async def sales_input_page(request: Request, error: Optional[str] = None):
+async def sales_input_page(request: Request, error: Optional[str] = None, store_id: Optional[str] = Depends(get_existing_store_id)):
     """Menampilkan halaman input penjualan dengan list produk master."""
     try:
-        products = excel_service.read_master_stock()
+        products = excel_service.read_master_stock(store_id=store_id)
     except Exception as e:
         products = []
         error = f"Gagal memuat Master Stok: {e}"
         
     return templates.TemplateResponse(
         "sales_input.html", 
-        {"request": request, "title": "Input Penjualan", "products": products, "error": error}
+        {"request": request, "title": "Input Penjualan", "products": products, "error": error, "store_id": store_id}
     )
     
 @app.post("/input-penjualan/add-item", response_class=HTMLResponse)
-async def add_sales_item(request: Request, product_name: str = Form(..., alias="nama_produk_select")):
+async def add_sales_item(
+    request: Request,
+    product_name: str = Form(..., alias="nama_produk_select"),
+    store_id: Optional[str] = Depends(get_existing_store_id),
+):
     """Endpoint HTMX untuk mengembalikan baris input penjualan baru."""
     
-    product_data_pair = excel_service.get_product_by_name(product_name)
+    product_data_pair = excel_service.get_product_by_name(product_name, store_id=store_id)
     
     if not product_data_pair:
         return HTMLResponse(content="<div class='text-red-500'>Produk tidak ditemukan.</div>", status_code=404)
     
     product, _ = product_data_pair
     
+    # default_unit dikirim balik oleh form sebagai `item_<index>_satuan_jual` (konversi HPP ke unit dasar)
     default_price = 0.0
     default_unit = ""
     for unit, price in product.harga_jual.model_dump().items():
@@ -183,7 +251,7 @@ async def add_sales_item(request: Request, product_name: str = Form(..., alias="
     )
     
 @app.post("/input-penjualan", response_class=RedirectResponse, status_code=303)
-async def submit_sales_transaction(request: Request):
+async def submit_sales_transaction(request: Request, store_id: Optional[str] = Depends(get_store_id)):
     """Menerima dan menyimpan semua transaksi penjualan dari form multi-entry."""
     form_data = await request.form()
     
@@ -198,51 +266,88 @@ async def submit_sales_transaction(request: Request):
                 unique_indices.add(parts[1])
                 
     if not unique_indices:
-        return RedirectResponse(url="/input-penjualan?error=Tidak ada item yang dimasukkan.", status_code=303)
+        return RedirectResponse(url=_with_store("/input-penjualan?error=Tidak ada item yang dimasukkan.", store_id), status_code=303)
 
     try:
-        transactions_to_write: list[JurnalPenjualan] = []
-        
-        for index in unique_indices:
-            nama_produk = form_data.get(f'item_{index}_nama_produk')
-            jumlah_jual = int(form_data.get(f'item_{index}_jumlah_jual'))
-            harga_jual_unit = float(form_data.get(f'item_{index}_harga_jual_unit'))
-            
-            total_harga_jual = jumlah_jual * harga_jual_unit
-            
-            transaction = JurnalPenjualan(
-                nama_produk=nama_produk,
-                jumlah_jual=jumlah_jual,
-                total_harga_jual=total_harga_jual,
-            )
-            transactions_to_write.append(transaction)
-
-        if transactions_to_write:
-             # Tambahkan catatan ke transaksi pertama (satu catatan untuk satu grup transaksi)
-             transactions_to_write[0].catatan = catatan
+        sales_form = SalesFormInput(
+            items=[
+                SalesItemInput(
+                    nama_produk=form_data.get(f'item_{index}_nama_produk'),
+                    jumlah_jual=int(form_data.get(f'item_{index}_jumlah_jual')),
+                    harga_jual_unit=float(form_data.get(f'item_{index}_harga_jual_unit')),
+                    satuan_jual=form_data.get(f'item_{index}_satuan_jual') or None,
+                )
+                for index in unique_indices
+            ],
+            catatan=catatan,
+        )
 
-        excel_service.write_sales_transaction(transactions_to_write)
+        excel_service.write_sales_transaction(_sales_form_to_journal(sales_form), store_id=store_id)
 
     except (ValueError, ValidationError) as e:
         import urllib.parse
         error_msg = urllib.parse.quote(f"Error Validasi/Data: {e}")
-        return RedirectResponse(url=f"/input-penjualan?error={error_msg}", status_code=303)
+        return RedirectResponse(url=_with_store(f"/input-penjualan?error={error_msg}", store_id), status_code=303)
 
-    return RedirectResponse(url="/input-penjualan?success=Transaksi Penjualan berhasil dicatat.", status_code=303)
+    return RedirectResponse(url=_with_store("/input-penjualan?success=Transaksi Penjualan berhasil dicatat.", store_id), status_code=303)
+
+@app.post("/api/penjualan/batch")
+async def submit_sales_batch(batch: SalesBatchInput, store_id: Optional[str] = Depends(get_existing_store_id)):
+    """
+    Menerima batch penjualan JSON dari beberapa keranjang/terminal (misal sinkronisasi terminal offline).
+    Seluruh batch divalidasi dulu, lalu ditulis ke Jurnal Penjualan dalam satu kali simpan.
+    """
+    try:
+        # Validasi nama produk sekaligus untuk seluruh batch (satu kali baca Master Stok)
+        known_products = {p.nama_produk for p in excel_service.read_master_stock(store_id=store_id)}
+        requested_products = {item.nama_produk for cart in batch.keranjang for item in cart.items}
+        unknown_products = sorted(requested_products - known_products)
+        if unknown_products:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Produk tidak ditemukan di Master Stok: {', '.join(unknown_products)}"
+            )
+
+        transactions_to_write: list[JurnalPenjualan] = []
+        for cart in batch.keranjang:
+            transactions_to_write.extend(_sales_form_to_journal(cart))
+
+        excel_service.write_sales_transaction(transactions_to_write, store_id=store_id)
+
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(status_code=422, detail=f"Error Validasi/Data: {e}")
+
+    return {
+        "status": "ok",
+        "jumlah_keranjang": len(batch.keranjang),
+        "jumlah_item": len(transactions_to_write),
+    }
+
+@app.get("/api/penjualan")
+async def list_sales_between(mulai: str, sampai: str, store_id: Optional[str] = Depends(get_existing_store_id)):
+    """Transaksi penjualan dalam rentang waktu (`YYYY-MM-DD` atau `YYYY-MM-DD HH:MM:SS`, inklusif)."""
+    try:
+        return excel_service.read_sales_between(mulai, sampai, store_id=store_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # --- D. JURNAL PEMBELIAN (TO BE IMPLEMENTED) ---
 @app.get("/input-pembelian", response_class=HTMLResponse)
-async def purchase_input_page(request: Request):
+async def purchase_input_page(request: Request, store_id: Optional[str] = Depends(get_existing_store_id)):
     return templates.TemplateResponse(
         "home.html", # Tempatkan template input pembelian di sini
-        {"request": request, "title": "Input Pembelian"}
+        {"request": request, "title": "Input Pembelian", "store_id": store_id}
     )
     
 @app.post("/input-pembelian/add-item", response_class=HTMLResponse)
-async def add_purchase_item(request: Request, product_name: str = Form(..., alias="nama_produk_select")):
+async def add_purchase_item(
+    request: Request,
+    product_name: str = Form(..., alias="nama_produk_select"),
+    store_id: Optional[str] = Depends(get_existing_store_id),
+):
     """Endpoint HTMX untuk mengembalikan baris input pembelian baru."""
     
-    product_data_pair = excel_service.get_product_by_name(product_name)
+    product_data_pair = excel_service.get_product_by_name(product_name, store_id=store_id)
     
     if not product_data_pair:
         return HTMLResponse(content="<div class='text-red-500'>Produk tidak ditemukan.</div>", status_code=404)
@@ -263,7 +368,7 @@ async def add_purchase_item(request: Request, product_name: str = Form(..., alia
     )
     
 @app.post("/input-pembelian", response_class=RedirectResponse, status_code=303)
-async def submit_purchase_transaction(request: Request):
+async def submit_purchase_transaction(request: Request, store_id: Optional[str] = Depends(get_store_id)):
     """Menerima dan menyimpan semua transaksi pembelian dari form multi-entry."""
     form_data = await request.form()
     
@@ -275,7 +380,7 @@ async def submit_purchase_transaction(request: Request):
                 unique_indices.add(parts[1])
                 
     if not unique_indices:
-        return RedirectResponse(url="/input-pembelian?error=Tidak ada item yang dimasukkan.", status_code=303)
+        return RedirectResponse(url=_with_store("/input-pembelian?error=Tidak ada item yang dimasukkan.", store_id), status_code=303)
 
     try:
         transactions_to_write: list[excel_service.JurnalPembelian] = []
@@ -286,15 +391,8 @@ async def submit_purchase_transaction(request: Request):
             satuan_beli = form_data.get(f'item_{index}_satuan_beli')
             total_harga_beli = float(form_data.get(f'item_{index}_total_harga_beli'))
             
-            # Hitung Harga Modal Baru (Harga Beli Per Satuan)
-            # Harga Beli Per Satuan = Total Harga Beli / Jumlah Beli
-            harga_modal_baru = round(total_harga_beli / jumlah_beli, 2) 
-            
-            # 1. Update Harga Modal di Master Stok
-            # Kita perlu membuat fungsi baru di excel_service
-            excel_service.update_master_stock_cost_price(nama_produk, harga_modal_baru)
-            
-            # 2. Buat model JurnalPembelian
+            # Buat model JurnalPembelian
+            # (harga modal rata-rata di Master Stok diperbarui oleh write_purchase_transaction)
             transaction = JurnalPembelian(
                 nama_produk=nama_produk,
                 jumlah_beli=jumlah_beli,
@@ -304,12 +402,67 @@ async def submit_purchase_transaction(request: Request):
             )
             transactions_to_write.append(transaction)
 
-        # 3. Simpan semua transaksi ke Jurnal Pembelian
-        excel_service.write_purchase_transaction(transactions_to_write)
+        # Simpan semua transaksi ke Jurnal Pembelian
+        excel_service.write_purchase_transaction(transactions_to_write, store_id=store_id)
 
     except (ValueError, ValidationError) as e:
         import urllib.parse
         error_msg = urllib.parse.quote(f"Error Validasi/Data: {e}")
-        return RedirectResponse(url=f"/input-pembelian?error={error_msg}", status_code=303)
+        return RedirectResponse(url=_with_store(f"/input-pembelian?error={error_msg}", store_id), status_code=303)
 
-    return RedirectResponse(url="/input-pembelian?success=Transaksi Pembelian berhasil dicatat dan modal diperbarui.", status_code=303)
+    return RedirectResponse(url=_with_store("/input-pembelian?success=Transaksi Pembelian berhasil dicatat dan modal diperbarui.", store_id), status_code=303)
+
+@app.get("/api/pembelian")
+async def list_purchases_between(mulai: str, sampai: str, store_id: Optional[str] = Depends(get_existing_store_id)):
+    """Transaksi pembelian dalam rentang waktu (`YYYY-MM-DD` atau `YYYY-MM-DD HH:MM:SS`, inklusif)."""
+    try:
+        return excel_service.read_purchases_between(mulai, sampai, store_id=store_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# --- E. LAPORAN ---
+@app.get("/laporan/lintas-outlet")
+def cross_store_report(stores: Optional[str] = None):
+    """
+    Total pendapatan dan penjualan per produk dari beberapa outlet (`?stores=a,b`, kosong = semua).
+    Route sync (dijalankan di threadpool) agar menunggu process pool tidak memblokir event loop.
+    """
+    store_ids = [s.strip() for s in stores.split(',') if s.strip()] if stores else None
+    try:
+        return excel_service.summarize_sales_across_stores(store_ids, executor=process_pool)
+    except excel_service.StoreNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/laporan/margin")
+async def gross_margin_report(store_id: Optional[str] = Depends(get_existing_store_id)):
+    """Laporan laba kotor (pendapatan - HPP) total dan per produk untuk satu outlet."""
+    return excel_service.report_gross_margin(store_id=store_id)
+
+# --- F. ADMIN ---
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Endpoint admin hanya aktif jika env MYPOS_ADMIN_TOKEN di-set dan header X-Admin-Token cocok."""
+    expected = os.environ.get("MYPOS_ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Endpoint admin nonaktif (MYPOS_ADMIN_TOKEN belum di-set).")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=403, detail="Token admin tidak valid.")
+
+@app.get("/admin/profiling", dependencies=[Depends(require_admin_token)])
+async def profiling_status():
+    """Status profiling dan sisa kuota sampel per route."""
+    return profiling.status()
+
+@app.post("/admin/profiling", dependencies=[Depends(require_admin_token)])
+async def toggle_profiling(aktif: bool, sampel: Optional[int] = None, interval_ms: Optional[float] = None):
+    """Mengaktifkan (`?aktif=true&sampel=N`) atau menonaktifkan (`?aktif=false`) profiling tanpa restart."""
+    try:
+        if aktif:
+            profiling.enable(samples_per_route=sampel, interval_ms=interval_ms)
+        else:
+            profiling.disable()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return profiling.status()
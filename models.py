@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List 
+from datetime import datetime
 
 # --- MODEL DATA DARI EXCEL (MASTER STOK) ---
 
@@ -25,6 +26,8 @@ class MasterStockProduct(BaseModel):
     kategori: str
     satuan_unit_dasar: str = Field(..., description="Satuan terkecil produk (misal: Bungkus, Sachet).") 
     harga_jual: HargaJual 
+    harga_modal: float = Field(0.0, description="Harga modal rata-rata tertimbang per unit dasar (HPP).")
+    stok_unit_dasar: float = Field(0.0, description="Stok tersedia dalam satuan unit dasar.")
     
     @property
     def price_display(self) -> str:
@@ -46,6 +49,8 @@ class JurnalPenjualan(BaseModel):
     jumlah_jual: int = Field(..., gt=0)
     total_harga_jual: float = Field(..., gt=0)
     catatan: Optional[str] = None
+    hpp: Optional[float] = None # Harga pokok penjualan, dicap saat transaksi ditulis
+    satuan_jual: Optional[str] = None # Satuan yang dijual (misal Bungkus, Seduh). Kosong = unit dasar
 
 class JurnalPembelian(BaseModel):
     """Struktur data untuk Jurnal Pembelian (Sheet_3_Jurnal_Pembelian)."""
@@ -62,8 +67,30 @@ class SalesItemInput(BaseModel):
     nama_produk: str
     jumlah_jual: int = Field(gt=0)
     harga_jual_unit: float = Field(ge=0) # Harga yang editable per unit
+    satuan_jual: Optional[str] = None # Satuan jual item (untuk konversi HPP ke unit dasar)
     
 class SalesFormInput(BaseModel):
     """Model untuk seluruh data yang disubmit dari form Penjualan."""
-    items: list[SalesItemInput] # Menggunakan list[type] (Python 3.9+)
-    catatan: Optional[str] = None
\ No newline at end of file
+    items: list[SalesItemInput] = Field(..., min_length=1) # Menggunakan list[type] (Python 3.9+)
+    catatan: Optional[str] = None
+    # Waktu transaksi di terminal (untuk sinkronisasi offline). Kosong = waktu server.
+    timestamp: Optional[str] = None
+
+    @field_validator('timestamp')
+    @classmethod
+    def validate_timestamp(cls, value: Optional[str]) -> Optional[str]:
+        """
+        Tolak tanggal/jam yang tidak mungkin (misal 2026-99-99), lalu kembalikan bentuk
+        zero-padded (2026-1-5 8:0:0 -> 2026-01-05 08:00:00) karena indeks waktu membandingkan string.
+        """
+        if value is None:
+            return value
+        try:
+            parsed = datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            raise ValueError("timestamp harus berformat 'YYYY-MM-DD HH:MM:SS' dengan tanggal dan jam yang valid.")
+        return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+class SalesBatchInput(BaseModel):
+    """Model untuk batch penjualan JSON dari satu atau beberapa terminal POS."""
+    keranjang: list[SalesFormInput] = Field(..., min_length=1, description="Satu entri per keranjang/transaksi.")
@@ -0,0 +1,280 @@
+"""
+Profiling on-demand untuk request yang lambat di proses yang sedang berjalan.
+
+Diaktifkan lewat env `MYPOS_PROFILE=1` atau endpoint admin `/admin/profiling`.
+Saat aktif, N request pertama per route disampling (stack thread diambil setiap
+beberapa milidetik) selama pemanggilan fungsi excel_service dan render template,
+lalu ditulis sebagai collapsed stack (format `flamegraph.pl` / speedscope) ke folder lokal.
+
+Saat nonaktif tidak ada yang dibungkus: fungsi asli excel_service dan
+TemplateResponse dipakai apa adanya, dan middleware langsung meneruskan request.
+"""
+import contextvars
+import functools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from starlette.routing import Match
+
+# --- KONFIGURASI ---
+PROFILE_ENV = 'MYPOS_PROFILE'
+PROFILE_SAMPLES_ENV = 'MYPOS_PROFILE_SAMPLES'
+PROFILE_DIR_ENV = 'MYPOS_PROFILE_DIR'
+PROFILE_INTERVAL_ENV = 'MYPOS_PROFILE_INTERVAL_MS'
+
+DEFAULT_SAMPLES_PER_ROUTE = 5
+DEFAULT_INTERVAL_MS = 1.0
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+
+_config = {
+    'aktif': False,
+    'sampel_per_rute': DEFAULT_SAMPLES_PER_ROUTE,
+    'output_dir': DEFAULT_OUTPUT_DIR,
+    'interval_ms': DEFAULT_INTERVAL_MS,
+}
+_sisa_sampel: Dict[str, int] = {}
+_lock = threading.Lock()
+
+# Target yang dibungkus saat profiling aktif: (objek, nama atribut, label)
+_targets: List[Tuple[object, str, str]] = []
+# Atribut asli sebelum dibungkus: {(id(objek), nama): (ada_di_instance, nilai_asli)}
+_originals: Dict[Tuple[int, str], Tuple[bool, object]] = {}
+
+_current_sampler = contextvars.ContextVar('mypos_profile_sampler', default=None)
+
+
+# --- SAMPLER ---
+
+def _collapse_stack(frame) -> str:
+    """Mengubah frame menjadi satu baris collapsed stack: root;...;leaf."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+class _RequestSampler:
+    """Sampling profiler untuk satu request: stack hanya diambil selama berada di dalam scope."""
+
+    def __init__(self, interval_ms: float):
+        self.stacks: Counter = Counter()
+        self.durasi_scope: Counter = Counter()
+        self._interval = interval_ms / 1000
+        self._depth = 0
+        self._label = None
+        self._thread_id = None
+        self._active = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='mypos-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    @contextmanager
+    def scope(self, label: str):
+        outermost = self._depth == 0
+        if outermost:
+            self._label = label
+            self._thread_id = threading.get_ident()
+            started = time.perf_counter()
+            self._active.set()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if outermost:
+                self._active.clear()
+                self.durasi_scope[label] += time.perf_counter() - started
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            if not self._active.is_set():
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.stacks[f"{self._label};{_collapse_stack(frame)}"] += 1
+
+
+# --- INSTRUMENTASI ---
+
+def _wrap(fn, label: str):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        sampler = _current_sampler.get()
+        if sampler is None:
+            return fn(*args, **kwargs)
+        with sampler.scope(label):
+            return fn(*args, **kwargs)
+    return wrapper
+
+def _patch(obj, name: str, label: str):
+    key = (id(obj), name)
+    if key in _originals:
+        return
+    in_instance = name in vars(obj)
+    original = getattr(obj, name)
+    _originals[key] = (in_instance, original)
+    setattr(obj, name, _wrap(original, label))
+
+def _unpatch(obj, name: str):
+    key = (id(obj), name)
+    if key not in _originals:
+        return
+    in_instance, original = _originals.pop(key)
+    if in_instance:
+        setattr(obj, name, original)
+    else:
+        delattr(obj, name)
+
+def register(obj, name: str, label: Optional[str] = None):
+    """Mendaftarkan atribut callable yang akan di-scope profiling saat aktif."""
+    label = label or name
+    with _lock:
+        _targets.append((obj, name, label))
+        if _config['aktif']:
+            _patch(obj, name, label)
+
+def instrument_module(module):
+    """Mendaftarkan semua fungsi publik yang didefinisikan di modul (misal excel_service)."""
+    short_name = module.__name__.rsplit('.', 1)[-1]
+    for name, value in list(vars(module).items()):
+        if name.startswith('_') or not callable(value) or getattr(value, '__module__', None) != module.__name__:
+            continue
+        if isinstance(value, type):
+            continue
+        register(module, name, f"{short_name}.{name}")
+
+
+# --- KONTROL ---
+
+def enable(samples_per_route: Optional[int] = None, output_dir: Optional[str] = None, interval_ms: Optional[float] = None):
+    """Mengaktifkan profiling dan mereset kuota sampel per route."""
+    with _lock:
+        if samples_per_route is not None:
+            if samples_per_route < 1:
+                raise ValueError("Jumlah sampel per route minimal 1.")
+            _config['sampel_per_rute'] = samples_per_route
+        if output_dir is not None:
+            _config['output_dir'] = output_dir
+        if interval_ms is not None:
+            if interval_ms <= 0:
+                raise ValueError("Interval sampling harus lebih dari 0 ms.")
+            _config['interval_ms'] = interval_ms
+        _sisa_sampel.clear()
+        for obj, name, label in _targets:
+            _patch(obj, name, label)
+        _config['aktif'] = True
+    print(f"🔬 Profiling AKTIF: {_config['sampel_per_rute']} sampel/route -> {_config['output_dir']}")
+
+def disable():
+    """Menonaktifkan profiling dan mengembalikan semua fungsi asli."""
+    with _lock:
+        _config['aktif'] = False
+        for obj, name, _ in _targets:
+            _unpatch(obj, name)
+    print("🔬 Profiling NONAKTIF.")
+
+def status() -> Dict:
+    with _lock:
+        return {
+            'aktif': _config['aktif'],
+            'sampel_per_rute': _config['sampel_per_rute'],
+            'interval_ms': _config['interval_ms'],
+            'output_dir': _config['output_dir'],
+            'sisa_sampel': dict(_sisa_sampel),
+        }
+
+def configure_from_env():
+    """Mengaktifkan profiling saat start jika MYPOS_PROFILE=1."""
+    if os.environ.get(PROFILE_ENV, '').lower() not in ('1', 'true', 'yes'):
+        return
+    samples = os.environ.get(PROFILE_SAMPLES_ENV)
+    interval = os.environ.get(PROFILE_INTERVAL_ENV)
+    enable(
+        samples_per_route=int(samples) if samples else None,
+        output_dir=os.environ.get(PROFILE_DIR_ENV) or None,
+        interval_ms=float(interval) if interval else None,
+    )
+
+def _take_sample(route_key: str) -> bool:
+    with _lock:
+        remaining = _sisa_sampel.get(route_key, _config['sampel_per_rute'])
+        if remaining <= 0:
+            return False
+        _sisa_sampel[route_key] = remaining - 1
+        return True
+
+
+# --- OUTPUT ---
+
+def _route_key(scope) -> str:
+    """Kunci route berbasis template path (misal `POST /master-stok/delete/{nama_produk}`)."""
+    app = scope.get('app')
+    router = getattr(app, 'router', None)
+    for route in getattr(router, 'routes', []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return f"{scope['method']} {route.path}"
+    return f"{scope['method']} {scope['path']}"
+
+def _write_profile(route_key: str, sampler: _RequestSampler, durasi_request: float) -> Optional[str]:
+    scope_ms = ', '.join(f"{label}={seconds * 1000:.1f}ms" for label, seconds in sampler.durasi_scope.most_common())
+    if not sampler.stacks:
+        print(f"🔬 {route_key}: {durasi_request * 1000:.1f} ms, tidak ada sampel ({scope_ms or 'tanpa scope'}).")
+        return None
+
+    output_dir = _config['output_dir']
+    os.makedirs(output_dir, exist_ok=True)
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', route_key).strip('_')
+    filename = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{slug}.collapsed"
+    file_path = os.path.join(output_dir, filename)
+
+    with open(file_path, 'w', encoding='utf-8') as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+    print(f"🔬 {route_key}: {durasi_request * 1000:.1f} ms, {sum(sampler.stacks.values())} sampel ({scope_ms}) -> {file_path}")
+    return file_path
+
+
+# --- MIDDLEWARE ---
+
+class ProfilingMiddleware:
+    """Middleware ASGI: saat nonaktif hanya satu pengecekan flag lalu request diteruskan."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not _config['aktif'] or scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        route_key = _route_key(scope)
+        if not _take_sample(route_key):
+            await self.app(scope, receive, send)
+            return
+
+        sampler = _RequestSampler(_config['interval_ms'])
+        sampler.start()
+        token = _current_sampler.set(sampler)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_sampler.reset(token)
+            sampler.stop()
+            _write_profile(route_key, sampler, time.perf_counter() - started)
@@ -1,17 +1,21 @@
 import os
 import sys
+import shutil
+import tempfile
+from contextlib import contextmanager
 from datetime import datetime
 
 # Tambahkan direktori saat ini ke path agar modul bisa diimpor
 # Ini penting saat menjalankan file dari root project
 sys.path.append(os.path.dirname(os.path.abspath(__file__))) 
 
+import excel_service
 from excel_service import (
     read_master_stock, create_master_stock, update_master_stock, 
     delete_master_stock, write_sales_transaction, FILE_PATH, 
     SHEET_MASTER_STOK, SHEET_JURNAL_PENJUALAN, _ensure_file_and_sheets
 )
-from models import MasterStockProduct, HargaJual, JurnalPenjualan
+from models import MasterStockProduct, HargaJual, JurnalPenjualan, JurnalPembelian
 
 # --- CONFIG ---
 TEST_PRODUCT_NAME = "Kopi Bubuk ABC"
@@ -119,11 +123,445 @@ def test_jurnal_write():
         print(f"   [GAGAL] Write Jurnal: {e}")
         return
 
+@contextmanager
+def temp_data_dir():
+    """Mengarahkan FILE_PATH ke folder sementara agar data uji tidak tercampur dengan data asli."""
+    original_file_path = excel_service.FILE_PATH
+    temp_dir = tempfile.mkdtemp(prefix="mypos-test-")
+    excel_service.FILE_PATH = os.path.join(temp_dir, "MyPos.xlsx")
+    try:
+        yield temp_dir
+    finally:
+        excel_service.FILE_PATH = original_file_path
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def test_multi_outlet_report():
+    """Menguji shard per outlet dan laporan penjualan lintas outlet."""
+    print("\n--- TEST: Multi Outlet ---")
+
+    with temp_data_dir():
+        for store_id, jumlah in [("warung-a", 2), ("warung-b", 3)]:
+            create_master_stock(MasterStockProduct(
+                nama_produk="Teh Botol", satuan_beli="Krat", isi_per_satuan_beli=12,
+                kategori="Minuman", satuan_unit_dasar="Botol", harga_jual=HargaJual(bungkus=5000.0)
+            ), store_id=store_id)
+            write_sales_transaction([
+                JurnalPenjualan(nama_produk="Teh Botol", jumlah_jual=jumlah, total_harga_jual=jumlah * 5000.0),
+            ], store_id=store_id)
+
+        # Outlet default tidak ikut tersentuh
+        assert not os.path.exists(excel_service.FILE_PATH)
+        assert read_master_stock(store_id="warung-a")[0].nama_produk == "Teh Botol"
+
+        report = excel_service.summarize_sales_across_stores(["warung-a", "warung-b"])
+        assert report["total_pendapatan"] == 25000.0
+        assert report["per_produk"]["Teh Botol"]["jumlah_jual"] == 5
+        assert report["per_outlet"]["warung-b"]["total_pendapatan"] == 15000.0
+
+        # Lewat process pool (seperti di aplikasi) hasilnya sama
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            assert excel_service.summarize_sales_across_stores(["warung-a", "warung-b"], executor=pool) == report
+
+        # Outlet ganda tidak dihitung dua kali
+        report = excel_service.summarize_sales_across_stores(["warung-a", "warung-a"])
+        assert report["total_pendapatan"] == 10000.0
+
+        # Jalur baca untuk outlet yang belum ada: 404 dan tidak membuat shard baru
+        from fastapi.testclient import TestClient
+        import main
+        client = TestClient(main.app)
+        assert client.get("/laporan/margin?store=typo123").status_code == 404
+        assert client.get("/api/penjualan?mulai=2026-01-01&sampai=2026-01-31&store=other").status_code == 404
+        assert client.get("/laporan/lintas-outlet?stores=warung-a,typo123").status_code == 404
+        try:
+            read_master_stock(store_id="typo123")
+            assert False, "outlet yang belum ada seharusnya ditolak"
+        except excel_service.StoreNotFoundError:
+            pass
+        assert excel_service.list_stores() == ["warung-a", "warung-b"]
+
+        # Newline di akhir store id tidak lolos validasi
+        for store_id in ["abc\n", "../abc", ""]:
+            try:
+                excel_service.get_store_file_path(store_id)
+                assert False, f"store id {store_id!r} seharusnya ditolak"
+            except ValueError:
+                pass
+        print("   [SUKSES] Laporan lintas outlet sesuai.")
+
+def test_snapshot_reads():
+    """Menguji snapshot baca: dipublish setiap commit dan dibangun ulang jika xlsx diubah di luar aplikasi."""
+    print("\n--- TEST: Snapshot Baca ---")
+
+    with temp_data_dir():
+        create_master_stock(MasterStockProduct(
+            nama_produk="Gula", satuan_beli="Sak", isi_per_satuan_beli=50,
+            kategori="Sembako", satuan_unit_dasar="Kg", harga_jual=HargaJual(mentah=15000.0)
+        ))
+        write_sales_transaction([JurnalPenjualan(nama_produk="Gula", jumlah_jual=2, total_harga_jual=30000.0)])
+
+        snapshot_path = excel_service._snapshot_path(excel_service.FILE_PATH)
+        assert os.path.exists(snapshot_path)
+        snapshot = excel_service._load_snapshot()
+        assert snapshot["jurnal"][SHEET_JURNAL_PENJUALAN]["ringkasan"]["total"] == 30000.0
+        assert [p.nama_produk for p in read_master_stock()] == ["Gula"]
+
+        # Edit langsung di Excel: snapshot lama basi dan harus dibangun ulang
+        import openpyxl
+        workbook = openpyxl.load_workbook(excel_service.FILE_PATH)
+        workbook[SHEET_MASTER_STOK].append(["Garam", "Dus", 40, "Sembako", "Bungkus", 2000])
+        workbook.save(excel_service.FILE_PATH)
+
+        assert [p.nama_produk for p in read_master_stock()] == ["Gula", "Garam"]
+
+        # Dua writer memuat versi yang sama: writer kedua tidak boleh meneruskan snapshot writer pertama
+        writer_a, sheet_a = excel_service._get_workbook_and_sheet(SHEET_JURNAL_PENJUALAN)
+        writer_b, sheet_b = excel_service._get_workbook_and_sheet(SHEET_JURNAL_PENJUALAN)
+        sheet_a.append(["2026-10-05 08:00:00", "Gula", 1, 15000.0, None, None])
+        excel_service._save_workbook(writer_a)
+        sheet_b.append(["2026-10-05 08:01:00", "Garam", 3, 6000.0, None, None])
+        excel_service._save_workbook(writer_b)
+
+        ringkasan = excel_service._load_snapshot()["jurnal"][SHEET_JURNAL_PENJUALAN]["ringkasan"]
+        assert ringkasan["total"] == 36000.0 # 30.000 (Gula awal) + 6.000 (Garam), baris writer A tertimpa
+        assert ringkasan["per_produk"]["Gula"]["jumlah"] == 2
+        assert ringkasan["per_produk"]["Garam"]["jumlah"] == 3
+        print("   [SUKSES] Snapshot dipublish dan dibangun ulang saat basi.")
+
+def _count_saves():
+    """Membungkus _save_workbook untuk menghitung berapa kali workbook disimpan."""
+    calls = []
+    original = excel_service._save_workbook
+
+    def counting_save(workbook, store_id=None):
+        calls.append(store_id)
+        return original(workbook, store_id)
+
+    excel_service._save_workbook = counting_save
+    return calls, original
+
+def test_sales_batch_api():
+    """Menguji endpoint JSON batch penjualan: satu kali simpan, validasi dan timestamp terminal."""
+    print("\n--- TEST: API Batch Penjualan ---")
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+
+    def cart(nama_produk="Susu", harga=6000.0, timestamp=None):
+        data = {"items": [{"nama_produk": nama_produk, "jumlah_jual": 1, "harga_jual_unit": harga}]}
+        if timestamp:
+            data["timestamp"] = timestamp
+        return data
+
+    def journal_rows():
+        return list(excel_service.iter_sales_journal())
+
+    with temp_data_dir():
+        create_master_stock(MasterStockProduct(
+            nama_produk="Susu", satuan_beli="Dus", isi_per_satuan_beli=24,
+            kategori="Minuman", satuan_unit_dasar="Kotak", harga_jual=HargaJual(bungkus=6000.0)
+        ))
+
+        # Dua keranjang (3 item) ditulis dengan satu kali simpan
+        body = {"keranjang": [
+            cart(timestamp="2026-10-01 07:15:00"),
+            {"items": [
+                {"nama_produk": "Susu", "jumlah_jual": 2, "harga_jual_unit": 6000.0},
+                {"nama_produk": "Susu", "jumlah_jual": 1, "harga_jual_unit": 5500.0},
+            ]},
+        ]}
+        calls, original_save = _count_saves()
+        try:
+            response = client.post("/api/penjualan/batch", json=body)
+        finally:
+            excel_service._save_workbook = original_save
+        assert response.status_code == 200
+        assert response.json()["jumlah_item"] == 3
+        assert len(calls) == 1
+        rows = journal_rows()
+        assert len(rows) == 3
+
+        # Timestamp terminal dipertahankan
+        assert rows[0].timestamp == "2026-10-01 07:15:00"
+
+        # Produk tidak dikenal: 400, tidak ada yang ditulis
+        response = client.post("/api/penjualan/batch", json={"keranjang": [cart(), cart(nama_produk="Tidak Ada")]})
+        assert response.status_code == 400
+        assert len(journal_rows()) == 3
+
+        # Harga 0: 422, tidak ada yang ditulis
+        response = client.post("/api/penjualan/batch", json={"keranjang": [cart(), cart(harga=0)]})
+        assert response.status_code == 422
+        assert len(journal_rows()) == 3
+
+        # Timestamp tidak mungkin: 422
+        response = client.post("/api/penjualan/batch", json={"keranjang": [cart(timestamp="2026-99-99 99:99:99")]})
+        assert response.status_code == 422
+        assert len(journal_rows()) == 3
+
+        # Timestamp tanpa nol di depan dinormalkan agar tetap ditemukan query rentang waktu
+        response = client.post("/api/penjualan/batch", json={"keranjang": [cart(timestamp="2026-1-5 8:0:0")]})
+        assert response.status_code == 200
+        assert journal_rows()[-1].timestamp == "2026-01-05 08:00:00"
+        result = excel_service.read_sales_between("2026-01-01", "2026-01-31")
+        assert [t.timestamp for t in result] == ["2026-01-05 08:00:00"]
+
+        # Satuan jual dari terminal ikut tercatat di jurnal
+        body = {"keranjang": [{"items": [{"nama_produk": "Susu", "jumlah_jual": 1, "harga_jual_unit": 130000.0, "satuan_jual": "Dus"}]}]}
+        assert client.post("/api/penjualan/batch", json=body).status_code == 200
+        assert journal_rows()[-1].satuan_jual == "Dus"
+        print("   [SUKSES] API batch penjualan sesuai.")
+
+def test_hpp_weighted_average():
+    """Menguji harga modal rata-rata tertimbang dari pembelian dan HPP yang dicap di penjualan."""
+    print("\n--- TEST: HPP Rata-rata Tertimbang ---")
+
+    with temp_data_dir():
+        create_master_stock(MasterStockProduct(
+            nama_produk="Mie Instan", satuan_beli="Dus", isi_per_satuan_beli=10,
+            kategori="Makanan", satuan_unit_dasar="Bungkus", harga_jual=HargaJual(mentah=2000.0)
+        ))
+
+        # 2 dus @10 = 20 bungkus seharga 20.000 -> modal 1.000/bungkus
+        excel_service.write_purchase_transaction([
+            JurnalPembelian(nama_produk="Mie Instan", jumlah_beli=2, satuan_beli="Dus", total_harga_beli=20000.0),
+        ])
+        write_sales_transaction([JurnalPenjualan(nama_produk="Mie Instan", jumlah_jual=5, total_harga_jual=10000.0)])
+
+        # Sisa 15 bungkus @1.000 + 10 bungkus @1.500 -> (15.000 + 15.000) / 25 = 1.200
+        excel_service.write_purchase_transaction([
+            JurnalPembelian(nama_produk="Mie Instan", jumlah_beli=1, satuan_beli="Dus", total_harga_beli=15000.0),
+        ])
+        product, _ = excel_service.get_product_by_name("Mie Instan")
+        assert product.harga_modal == 1200.0
+        assert product.stok_unit_dasar == 25
+        assert product.satuan_beli == "Dus"
+
+        write_sales_transaction([JurnalPenjualan(nama_produk="Mie Instan", jumlah_jual=5, total_harga_jual=10000.0)])
+
+        report = excel_service.report_gross_margin()
+        assert report["pendapatan"] == 20000.0
+        assert report["hpp"] == 11000.0
+        assert report["laba_kotor"] == 9000.0
+        print(f"   [SUKSES] HPP sesuai. Margin: {report['margin_persen']}%")
+
+def test_hpp_sale_before_purchase():
+    """Menguji penjualan produk yang belum pernah dibeli: HPP kosong dan tercatat di laporan."""
+    print("\n--- TEST: HPP Sebelum Pembelian ---")
+
+    with temp_data_dir():
+        create_master_stock(MasterStockProduct(
+            nama_produk="Kerupuk", satuan_beli="Bal", isi_per_satuan_beli=20,
+            kategori="Makanan", satuan_unit_dasar="Bungkus", harga_jual=HargaJual(bungkus=1000.0)
+        ))
+        sale = JurnalPenjualan(nama_produk="Kerupuk", jumlah_jual=2, total_harga_jual=2000.0)
+        write_sales_transaction([sale])
+        assert sale.hpp is None
+
+        report = excel_service.report_gross_margin()
+        assert report["hpp"] == 0.0
+        assert report["jumlah_transaksi_tanpa_hpp"] == 1
+        assert list(excel_service.iter_sales_journal())[0].hpp is None
+        print("   [SUKSES] Penjualan tanpa harga modal ditandai di laporan.")
+
+def test_hpp_sale_units():
+    """Menguji HPP dan stok untuk penjualan dengan satuan jual selain unit dasar."""
+    print("\n--- TEST: HPP per Satuan Jual ---")
+
+    with temp_data_dir():
+        create_master_stock(MasterStockProduct(
+            nama_produk="Rokok Kretek", satuan_beli="Slop", isi_per_satuan_beli=200,
+            kategori="Rokok", satuan_unit_dasar="Batang", harga_jual=HargaJual(bungkus=25000.0, batang=1500.0)
+        ))
+        # 1 slop = 200 batang seharga 200.000 -> modal 1.000/batang
+        excel_service.write_purchase_transaction([
+            JurnalPembelian(nama_produk="Rokok Kretek", jumlah_beli=1, satuan_beli="Slop", total_harga_beli=200000.0),
+        ])
+
+        batang = JurnalPenjualan(nama_produk="Rokok Kretek", jumlah_jual=3, total_harga_jual=4500.0, satuan_jual="Batang")
+        slop = JurnalPenjualan(nama_produk="Rokok Kretek", jumlah_jual=1, total_harga_jual=240000.0, satuan_jual="Slop")
+        # Isi batang per bungkus tidak ada di Master Stok: HPP dikosongkan, bukan dihitung 1 batang
+        bungkus = JurnalPenjualan(nama_produk="Rokok Kretek", jumlah_jual=1, total_harga_jual=25000.0, satuan_jual="Bungkus")
+        write_sales_transaction([batang, slop, bungkus])
+
+        assert batang.hpp == 3000.0
+        assert slop.hpp == 200000.0
+        assert bungkus.hpp is None
+        product, _ = excel_service.get_product_by_name("Rokok Kretek")
+        assert product.stok_unit_dasar == 200 - 3 - 200
+
+        report = excel_service.report_gross_margin()
+        assert report["hpp"] == 203000.0
+        assert report["jumlah_transaksi_tanpa_hpp"] == 1
+        assert [t.satuan_jual for t in excel_service.iter_sales_journal()] == ["Batang", "Slop", "Bungkus"]
+        print("   [SUKSES] HPP dikonversi ke unit dasar, satuan tak dikenal ditandai.")
+
+def test_time_range_query():
+    """Menguji query rentang waktu jurnal lewat indeks waktu, termasuk baris dengan timestamp mundur."""
+    print("\n--- TEST: Query Rentang Waktu ---")
+
+    original_block_rows = excel_service.TIME_INDEX_BLOCK_ROWS
+    excel_service.TIME_INDEX_BLOCK_ROWS = 4 # Blok kecil agar indeks punya beberapa blok
+    try:
+        with temp_data_dir():
+            transactions = [
+                JurnalPenjualan(
+                    timestamp=f"2026-10-03 {hour:02d}:00:00", nama_produk="Roti",
+                    jumlah_jual=1, total_harga_jual=float(hour * 1000)
+                )
+                for hour in range(6, 18)
+            ]
+            for start in range(0, len(transactions), 3):
+                write_sales_transaction(transactions[start:start + 3])
+
+            result = excel_service.read_sales_between("2026-10-03 08:00:00", "2026-10-03 12:00:00")
+            assert [t.timestamp[11:13] for t in result] == ["08", "09", "10", "11", "12"]
+            assert excel_service.read_sales_between("2026-10-04", "2026-10-05") == []
+
+            # Sinkronisasi offline: timestamp mundur tetap ditemukan
+            write_sales_transaction([JurnalPenjualan(
+                timestamp="2026-10-03 09:30:00", nama_produk="Roti", jumlah_jual=1, total_harga_jual=9500.0
+            )])
+            result = excel_service.read_sales_between("2026-10-03 09:00:00", "2026-10-03 10:00:00")
+            assert sorted(t.timestamp[11:16] for t in result) == ["09:00", "09:30", "10:00"]
+            print("   [SUKSES] Query rentang waktu sesuai.")
+    finally:
+        excel_service.TIME_INDEX_BLOCK_ROWS = original_block_rows
+
+def test_profiling_toggle():
+    """Menguji profiling: fungsi hanya dibungkus saat aktif dan dikembalikan utuh saat nonaktif."""
+    print("\n--- TEST: Profiling Toggle ---")
+    import types
+    import profiling
+
+    def hitung():
+        return sum(range(1000))
+
+    target = types.SimpleNamespace(hitung=hitung)
+    profiling.register(target, "hitung", "uji.hitung")
+    try:
+        assert target.hitung is hitung
+
+        with temp_data_dir() as temp_dir:
+            profiling.enable(samples_per_route=1, output_dir=temp_dir)
+            assert target.hitung is not hitung
+            assert target.hitung() == hitung()
+
+            profiling.disable()
+            assert target.hitung is hitung
+        print("   [SUKSES] Profiling hanya aktif saat dinyalakan.")
+    finally:
+        profiling.disable()
+        profiling._targets[:] = [t for t in profiling._targets if t[0] is not target]
+
+def test_profiling_middleware():
+    """Menguji middleware profiling: N request pertama per route disampling dan ditulis sebagai collapsed stack."""
+    print("\n--- TEST: Profiling Middleware ---")
+    import re
+    import profiling
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    original_switch_interval = sys.getswitchinterval()
+    with temp_data_dir() as temp_dir:
+        create_master_stock(MasterStockProduct(
+            nama_produk="Beras", satuan_beli="Karung", isi_per_satuan_beli=25,
+            kategori="Sembako", satuan_unit_dasar="Kg", harga_jual=HargaJual(mentah=14000.0)
+        ))
+        write_sales_transaction([
+            JurnalPenjualan(timestamp=f"2026-10-06 08:{i % 60:02d}:00", nama_produk="Beras", jumlah_jual=1, total_harga_jual=14000.0)
+            for i in range(300)
+        ])
+        excel_service.write_purchase_transaction([
+            JurnalPembelian(nama_produk="Beras", jumlah_beli=1, satuan_beli="Karung", total_harga_beli=300000.0)
+            for _ in range(300)
+        ])
+
+        output_dir = os.path.join(temp_dir, "profiles")
+        # Switch interval kecil agar thread sampler cukup sering mendapat giliran selama request
+        sys.setswitchinterval(0.0001)
+        try:
+            profiling.enable(samples_per_route=1, output_dir=output_dir, interval_ms=0.5)
+            for _ in range(2):
+                assert client.get("/api/penjualan?mulai=2026-10-06&sampai=2026-10-06").status_code == 200
+                assert client.get("/api/pembelian?mulai=2000-01-01&sampai=2100-12-31").status_code == 200
+        finally:
+            profiling.disable()
+            sys.setswitchinterval(original_switch_interval)
+
+        # Kuota 1 sampel per route: dua request per route, tepat satu file per route
+        files = sorted(os.listdir(output_dir))
+        assert sorted(f.split("_", 1)[1] for f in files) == ["GET_api_pembelian.collapsed", "GET_api_penjualan.collapsed"]
+        for filename in files:
+            with open(os.path.join(output_dir, filename), encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            assert lines
+            # Format collapsed stack: `label;frame;...;frame <jumlah>`
+            assert all(re.fullmatch(r"excel_service\.read_(sales|purchases)_between;.+ \d+", line) for line in lines)
+        print(f"   [SUKSES] Profil ditulis per route: {', '.join(files)}")
+
+def test_streaming_readers():
+    """Menguji pembaca generator: filter, limit (berhenti lebih awal) dan batch."""
+    print("\n--- TEST: Pembaca Streaming ---")
+
+    with temp_data_dir():
+        for nama in ["Kopi", "Teh"]:
+            create_master_stock(MasterStockProduct(
+                nama_produk=nama, satuan_beli="Renteng", isi_per_satuan_beli=10,
+                kategori="Minuman", satuan_unit_dasar="Sachet", harga_jual=HargaJual(seduh=4000.0)
+            ))
+        write_sales_transaction([
+            JurnalPenjualan(nama_produk="Kopi" if i % 2 else "Teh", jumlah_jual=i, total_harga_jual=i * 4000.0)
+            for i in range(1, 11)
+        ])
+
+        assert [p.nama_produk for p in excel_service.iter_master_stock(nama_produk="Teh")] == ["Teh"]
+
+        kopi = list(excel_service.iter_sales_journal(nama_produk="Kopi"))
+        assert [t.jumlah_jual for t in kopi] == [1, 3, 5, 7, 9]
+
+        besar = list(excel_service.iter_sales_journal(where=lambda t: t.jumlah_jual > 5, limit=2))
+        assert [t.jumlah_jual for t in besar] == [6, 7]
+
+        # limit=0 tidak mengembalikan baris sama sekali
+        assert list(excel_service.iter_sales_journal(limit=0)) == []
+        assert list(excel_service.iter_master_stock(limit=0)) == []
+
+        # batch_size=0 ditolak, sama seperti iter_batches
+        for reader in (excel_service.iter_master_stock, excel_service.iter_sales_journal, excel_service.iter_purchase_journal):
+            try:
+                list(reader(batch_size=0))
+                assert False, f"{reader.__name__}(batch_size=0) seharusnya ditolak"
+            except ValueError:
+                pass
+
+        batches = list(excel_service.iter_sales_journal(batch_size=4))
+        assert [len(b) for b in batches] == [4, 4, 2]
+
+        # Berhenti di tengah batch: generator bisa ditutup tanpa membaca sisa sheet
+        stream = excel_service.iter_sales_journal(batch_size=3)
+        assert len(next(stream)) == 3
+        stream.close()
+        print("   [SUKSES] Pembaca streaming sesuai.")
+
 # --- MAIN EXECUTION ---
 if __name__ == "__main__":
     cleanup_and_setup()
     test_master_stock_crud()
     test_jurnal_write()
+    test_multi_outlet_report()
+    test_snapshot_reads()
+    test_sales_batch_api()
+    test_hpp_weighted_average()
+    test_hpp_sale_before_purchase()
+    test_hpp_sale_units()
+    test_time_range_query()
+    test_profiling_toggle()
+    test_profiling_middleware()
+    test_streaming_readers()
     print("\n==================================")
     print(f"⭐ SCRIPT SELESAI. Cek file {FILE_PATH} untuk verifikasi manual.")
     print("==================================")
\ No newline at end of file